@@ -1,8 +1,29 @@
 import atexit
+import hashlib
+import heapq
+import inspect
+import json
 import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import warnings
 import weakref
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from itertools import count
 from pathlib import Path
-from typing import Any, Iterable, List
+from pickle import HIGHEST_PROTOCOL, dumps as pdumps, loads as ploads
+from time import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 from . import (
     tryline,
@@ -12,41 +33,425 @@ from . import (
     to_pickle,
 )
 
-SUPPORTED_FORMATS = ["json", "pickle"]
+SUPPORTED_FORMATS = ["json", "pickle", "sqlite"]
+SUPPORTED_POLICIES = ["lru", "lfu"]
 REFRESH_INTERVAL = 180
+SHUTDOWN_TIMEOUT = 10
+HOT_ENTRIES = 10000
+# Fixed so that keys pickled by other Python versions are found again.
+KEY_PROTOCOL = 4
+
+_MISSING = object()
+# Journals are compacted once they hold more records than the cache holds
+# entries, and at least this many.
+MIN_JOURNAL_RECORDS = 1000
 
 
 class ExcludedMiddleViolation(ValueError): ...
 
 class UnsupportedFormatForPersistenceError(ValueError): ...
 
+class UnsupportedEvictionPolicyError(ValueError): ...
+
+class UnsupportedOptionForFormatError(ValueError): ...
+
+class IncompatibleOptionsError(ValueError): ...
+
+
+def _sizeof(key: Any, val: Any) -> int:
+    # Size of an entry, approximated by the length of its pickled form.
+    return len(pdumps((key, val), protocol=HIGHEST_PROTOCOL))
+
+
+def _call_key(
+    func: Callable,
+    signature: inspect.Signature,
+    args: tuple,
+    kwargs: Dict[str, Any]
+) -> str:
+    # The arguments are bound to the parameters of `func` first, so that
+    # all ways of passing the same arguments give the same key, and then
+    # hashed in JSON form, so that keys are the same in every process.
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    encoded = json.dumps(
+        list(bound.arguments.items()), sort_keys=True, default=repr
+    ).encode()
+    return f"{func.__module__}.{func.__qualname__}:{hashlib.sha256(encoded).hexdigest()}"
+
+
+def _map_in_threads(func: Callable, items: List[Any], workers: int) -> List[Any]:
+    if len(items) < 2 or workers < 2:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(min(workers, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+def _read_entries(
+    path: Path,
+    path_expires: Path,
+    format: str
+) -> Tuple[Dict[Any, Any], Dict[Any, float]]:
+    # Returns the entries in a cache file and their expiration times.
+    if not os.path.exists(path):
+        return dict([]), dict([])
+    load = from_json if format == "json" else from_pickle
+    records = load(path)
+    expires = load(path_expires) if path_expires.exists() else dict([])
+    return records, expires
+
+
+def _write_entries(
+    records: Dict[Any, Any],
+    expires: Dict[Any, float],
+    path: Path,
+    path_expires: Path,
+    format: str
+) -> None:
+    _write_atomically(records, path, format)
+    if expires:
+        _write_atomically(expires, path_expires, format)
+    elif path_expires.exists():
+        os.remove(path_expires)
+
+
+def _file_mode(path: Path) -> int:
+    # Mode of the file at `path`, or the mode `open` would give a new file.
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _write_atomically(data: Any, path: Path, format: str) -> None:
+    # Writes to a temporary file in the same folder and renames it over
+    # `path`, so that a crash never leaves a partially written file.
+    handle, temporary = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
+    os.close(handle)
+    try:
+        if format == "json":
+            to_json(data, temporary)
+        else:
+            to_pickle(data, temporary)
+        # `mkstemp` creates the file readable by its owner only.
+        os.chmod(temporary, _file_mode(path))
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def _flush_periodically(
+    ref: weakref.ref,
+    wake: threading.Event,
+    stop: threading.Event,
+    interval: Optional[float]
+) -> None:
+    # Body of the flusher thread, which only holds a weak reference to the
+    # cache so that it does not keep it alive.
+    while not stop.is_set():
+        wake.wait(interval)
+        wake.clear()
+        cache = ref()
+        if cache is None or stop.is_set():
+            return
+        try:
+            cache.persist()
+        except Exception as error:
+            warnings.warn(f"could not flush {cache.path}: {error!r}")
+        del cache
+
 
 class Cachionary:
+    """
+    A dictionary persisted to disk in JSON or pickle format. Existing
+    entries are loaded from `path` when it is created and all entries are
+    written back on program exit.
+
+    With format "sqlite", entries are instead kept in an SQLite database
+    at `path`, one row per entry with its pickled key and value, and
+    nothing is loaded up front. Looking up a key is an indexed query, and
+    the entries used last are kept in memory (see `hot_entries`), so that
+    memory is proportional to the working set and opening the cache takes
+    the same time regardless of its size. Keys are compared by their
+    pickled form.
+
+    The cache can be bounded by number of entries, by size or by age, in
+    which case entries are evicted in memory as soon as a bound is exceeded
+    and only the entries within bounds are persisted.
+
+    Parameters
+    ----------
+    path: str | Path
+        Location of the cache file, as a POSIX path.
+
+    format: str
+        One of `SUPPORTED_FORMATS`.
+
+    hot_entries: int
+        With format "sqlite", maximum number of entries kept in memory.
+        Changed entries are written to the database before being dropped
+        from memory.
+
+    max_entries: Optional[int]
+        Maximum number of entries. No limit by default. Not supported with
+        format "sqlite".
+
+    max_bytes: Optional[int]
+        Maximum total size of the entries, each one measured as the length
+        of its pickled form. No limit by default. Not supported with format
+        "sqlite".
+
+    ttl: Optional[float]
+        Default time to live of the entries, in seconds since they were set.
+        Expired entries are dropped on access and on persist, and their
+        expiration times are persisted next to the cache file (with suffix
+        ".expires", or in the database), so they carry over to the next
+        session. Entries never
+        expire by default. See method `set` for a time to live per entry.
+
+    policy: str
+        One of `SUPPORTED_POLICIES`, the entries evicted first when the
+        cache is full: the least recently used ones ("lru", default) or the
+        least frequently used ones ("lfu"). Use counts are not persisted.
+
+    journal: bool
+        If set to true, every change is appended to a journal next to the
+        cache file (with suffix ".journal") as soon as it is made, as a JSON
+        line or a length-prefixed pickle depending on `format`, and
+        persisting the cache only flushes the journal. The cache file is
+        rewritten as a snapshot of all entries (and the journal emptied)
+        only once the journal holds more records than the cache holds
+        entries, so the cost of persisting grows with the number of
+        changes instead of the size of the cache. Reloading replays the
+        journal on top of the snapshot, skipping a last record left
+        incomplete by a crash. The order of use of the entries (see
+        `policy`) is only kept up to the last snapshot. Not supported with
+        format "sqlite", which writes changed entries only anyway.
+
+    flush_interval: Optional[float]
+        A background thread persists the cache every `flush_interval`
+        seconds (`REFRESH_INTERVAL` by default), besides on program exit, so
+        that a crash loses at most the changes of the last interval. If
+        None, the cache is only persisted on exit or when requested.
+
+    flush_every: Optional[int]
+        If given, the background thread also persists the cache as soon as
+        `flush_every` changes have been made since it was last persisted.
+
+    shared: bool
+        If set to true, several processes can use the same cache file at
+        once. Persisting then takes an exclusive lock on a file next to the
+        cache file (with suffix ".lock"), reads the entries persisted by
+        other processes in the meantime and merges them with the entries
+        changed by this process, which take precedence, instead of
+        overwriting the file with the entries of this process only. The
+        entries read are also added to this cache. Requires module `fcntl`
+        (POSIX systems) and is not supported with `journal`. With format
+        "sqlite", the database already merges the changes of all processes
+        and this option has no effect.
+
+    refresh_on_miss: bool
+        If set to true along with `shared`, looking up a key that is not in
+        the cache first reads the entries persisted by other processes, if
+        the cache file changed since it was last read (see method
+        `refresh`).
+
+    shards: int
+        If greater than 1, entries are split by hash of their key among
+        `shards` files next to `path` (with suffixes ".0", ".1", etc.), and
+        `path` itself is not written. The files are read and written in
+        parallel by a pool of threads, as many as shards or cores, whichever
+        is fewer, and persisting only rewrites the files holding changed
+        entries. The number of shards of a cache must stay the same across
+        sessions, and the order of use of the entries (see `policy`) is not
+        persisted. Not supported with format "sqlite", nor with `journal`
+        or `shared`.
+
+    Persisting writes nothing unless entries were changed since the cache
+    was last persisted, which the keys of the entries changed are kept in
+    `new_keys` for. Files are written to a temporary file first and then
+    renamed, so they are never left half-written.
+
+    Attributes
+    ----------
+    n_evicted: int
+        Number of entries evicted to stay within `max_entries` and
+        `max_bytes`.
+
+    n_expired: int
+        Number of entries dropped because their time to live was over.
+
+    Examples
+    --------
+    >>> import os
+    >>> cache = Cachionary("cachionary_doctest.json", max_entries=2)
+    >>> cache["a"], cache["b"] = 1, 2
+    >>> _ = cache["a"]
+    >>> cache["c"] = 3
+    >>> cache.keys(), cache.n_evicted
+    (['a', 'c'], 1)
+    >>> cache.persist()
+    >>> del cache
+    >>> os.remove("cachionary_doctest.json")
+
+    """
 
     def __init__(
         self,
         path: str | Path,
-        format: str = "json"         # SUPPORTED_FORMATS
+        format: str = "json",        # SUPPORTED_FORMATS
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        policy: str = "lru",         # SUPPORTED_POLICIES
+        journal: bool = False,
+        flush_interval: Optional[float] = REFRESH_INTERVAL,
+        flush_every: Optional[int] = None,
+        hot_entries: int = HOT_ENTRIES,
+        shared: bool = False,
+        refresh_on_miss: bool = False,
+        shards: int = 1
     ) -> None:
         tryline(
             lambda x: x in SUPPORTED_FORMATS,
             UnsupportedFormatForPersistenceError,
             [format]
         )
+        if policy not in SUPPORTED_POLICIES:
+            raise UnsupportedEvictionPolicyError(
+                f"got {policy} but expected {str(SUPPORTED_POLICIES)}"
+            )
+        if format == "sqlite" and (
+            max_entries is not None or max_bytes is not None or journal
+        ):
+            raise UnsupportedOptionForFormatError(
+                "max_entries, max_bytes and journal are not supported with "
+                "format sqlite"
+            )
+        if format == "sqlite" and shards > 1:
+            raise UnsupportedOptionForFormatError(
+                "shards are not supported with format sqlite"
+            )
+        if shared and journal:
+            raise IncompatibleOptionsError("shared does not support journal")
+        if shards > 1 and (shared or journal):
+            raise IncompatibleOptionsError(
+                "shards do not support shared nor journal"
+            )
+        if shared and fcntl is None:
+            raise IncompatibleOptionsError(
+                "shared requires module fcntl, only available on POSIX systems"
+            )
         self.format = format
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.policy = policy
+        self.journal = journal
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.hot_entries = max(hot_entries, 1)
+        self.shared = shared
+        self.refresh_on_miss = refresh_on_miss
+        self.shards = max(shards, 1)
+        self.workers = min(self.shards, os.cpu_count() or 1)
+        # Keys of the entries set or dropped since the last persist.
         self.new_keys = set([])
         self.path = Path(path).expanduser().resolve() if isinstance(path, str) else path
         self.path.parent.mkdir(exist_ok=True, parents=True)
-        self.payload = dict([])
+        # Entries are kept from least to most recently used.
+        self.payload = OrderedDict([])
+        self.expires = dict([])
+        self.sizes = dict([])
+        self.nbytes = 0
+        self.hits = dict([])
+        self.n_evicted = 0
+        self.n_expired = 0
+        # (expiration time, sequence, key) and (hits, sequence, key) heaps.
+        # Stale items are skipped when popped.
+        self._expirations = []
+        self._uses = []
+        self._sequence = count()
+        # Journal file open for appending, and number of records in it.
+        self._journal = None
+        self._journal_records = 0
+        # Held by every method reading or changing the entries, as the
+        # flusher thread persists them concurrently.
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._db = None
+        # Computations in progress in `memoize`d functions, by key.
+        self._flights = dict([])
+        # Identity of the cache file when it was last read or written.
+        self._version = None
+        # Keys of the entries in every shard, if `shards` is greater than 1,
+        # and the shard of every key. Keys keep the shard they were first
+        # stored in, as equal keys (e.g. 1 and 1.0) may hash differently.
+        self._shard_keys = [set([]) for _ in range(self.shards)] if self.shards > 1 else []
+        self._shard_of = dict([])
+        self._dirty_shards = set([])
         self.reload()
         ref = weakref.ref(self)
-        atexit.register(lambda: ref() and ref().persist())
+        if flush_interval is not None or flush_every is not None:
+            self._flusher = threading.Thread(
+                target=_flush_periodically,
+                args=(ref, self._wake, self._stop, flush_interval),
+                name=f"cachionary-flusher-{self.path.name}",
+                daemon=True,
+            )
+            self._flusher.start()
+        atexit.register(lambda: ref() and ref().close())
     
+    @property
+    def path_expires(self) -> Path:
+        return self.path.with_name(self.path.name + ".expires")
+
+    @property
+    def path_journal(self) -> Path:
+        return self.path.with_name(self.path.name + ".journal")
+
+    @property
+    def path_lock(self) -> Path:
+        return self.path.with_name(self.path.name + ".lock")
+
+    def __shard_paths(self, idx: int) -> Tuple[Path, Path]:
+        path = self.path.with_name(f"{self.path.name}.{idx}")
+        return path, path.with_name(path.name + ".expires")
+
     def __len__(self) -> int:
-        return len(self.payload) + len(self.new_keys)
+        with self._lock:
+            self.__expire()
+            if self._db is None:
+                return len(self.payload)
+            self.__write_rows()
+            (n_entries,) = self._db.execute(
+                "SELECT COUNT(*) FROM entries WHERE expires IS NULL OR expires > ?",
+                (time(),)
+            ).fetchone()
+            return n_entries
     
     def __iter__(self) -> Iterable[Any]:
-        for key in self.payload.keys():
+        with self._lock:
+            self.__expire()
+            if self._db is None:
+                keys = list(self.payload.keys())
+            else:
+                self.__write_rows()
+                keys = [
+                    ploads(key) for (key,) in self._db.execute(
+                        "SELECT key FROM entries "
+                        "WHERE expires IS NULL OR expires > ?",
+                        (time(),)
+                    )
+                ]
+        for key in keys:
             yield key
     
     def keys(self) -> List[Any]:
@@ -56,36 +461,324 @@ class Cachionary:
         return [self[key] for key in self]
     
     def reload(self) -> None:
-        if not os.path.exists(self.path):
+        with self._lock:
+            self.__reload()
+
+    def __reload(self) -> None:
+        if self.format == "sqlite":
+            self.__connect()
             return
-        prev_records = (
-            from_json(self.path) if self.format == "json"
-            else from_pickle(self.path)
+        with self.__file_lock(exclusive=False):
+            parts = self.__read_files()
+        for shard, (prev_records, prev_expires) in enumerate(parts):
+            for key, val in prev_records.items():
+                self.__store(key, val, prev_expires.get(key), shard)
+        if self.journal and self.path_journal.exists():
+            self.__replay()
+        self.__expire()
+        self.__evict()
+
+    def __read_files(self) -> List[Tuple[Dict[Any, Any], Dict[Any, float]]]:
+        # Returns the entries in every shard file, or in the cache file if
+        # not sharded, and their expiration times.
+        self._version = self.__stat()
+        if self.shards == 1:
+            return [_read_entries(self.path, self.path_expires, self.format)]
+        return _map_in_threads(
+            lambda idx: _read_entries(*self.__shard_paths(idx), self.format),
+            list(range(self.shards)),
+            self.workers
         )
-        self.payload.update(prev_records)
 
-    def persist(self):
+    def __shard(self, key: Any) -> int:
+        # JSON turns keys into strings, so they are hashed as such to land
+        # in the same shard once reloaded.
+        encoded = (
+            str(key).encode() if self.format == "json"
+            else pdumps(key, protocol=KEY_PROTOCOL)
+        )
+        return zlib.crc32(encoded) % self.shards
+
+    def __stat(self) -> Optional[Tuple[int, int, int]]:
+        # Files are replaced on write, so a new inode means a new version.
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @contextmanager
+    def __file_lock(self, exclusive: bool) -> Iterator[None]:
+        # Lock shared by all processes using the cache, if `shared`.
+        if not self.shared:
+            yield
+            return
+        with open(self.path_lock, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def __merge_files(self) -> None:
+        # Entries not changed by this process are updated with their value
+        # in the cache file, or forgotten if no longer there.
+        # Shared caches are never sharded, so there is a single file.
+        [(prev_records, prev_expires)] = self.__read_files()
+        # JSON turns keys into strings, so keys are matched in that form.
+        keys = {self.__file_key(key): key for key in self.payload}
+        for file_key, key in keys.items():
+            if key not in self.new_keys and file_key not in prev_records:
+                self.__forget(key)
+        for file_key, val in prev_records.items():
+            key = keys.get(file_key, file_key)
+            if key in self.new_keys:
+                continue
+            expires = prev_expires.get(file_key)
+            if (
+                self.payload.get(key, _MISSING) != val
+                or self.expires.get(key) != expires
+            ):
+                self.__store(key, val, expires)
+        self.__expire()
+        self.__evict()
+
+    def __file_key(self, key: Any) -> Any:
+        # Key as read back from the cache file.
+        if self.format != "json" or isinstance(key, str):
+            return key
+        return next(iter(json.loads(json.dumps({key: None}))))
+
+    def refresh(self) -> None:
+        """
+        Adds to the cache the entries persisted by other processes since
+        the cache file was last read, and drops those they removed. Entries
+        changed by this process and not persisted yet are kept as they are.
+        Only useful with `shared`.
+        """
+        with self._lock:
+            if self._db is not None:
+                return
+            with self.__file_lock(exclusive=False):
+                self.__merge_files()
+
+    def __refresh_if_changed(self, key: Any) -> None:
+        if (
+            self.refresh_on_miss
+            and self.shared
+            and self._db is None
+            and key not in self.payload
+            and self.__stat() != self._version
+        ):
+            self.refresh()
+
+    def __connect(self) -> None:
+        # Entries changed in memory are written before forgetting the rest.
+        if self._db is not None:
+            self.__write_rows()
+            self._db.close()
+        for key in list(self.payload):
+            self.__forget(key)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key BLOB PRIMARY KEY, value BLOB NOT NULL, expires REAL) "
+                "WITHOUT ROWID"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires) "
+                "WHERE expires IS NOT NULL"
+            )
+
+    def __fetch(self, key: Any) -> None:
+        # Loads an entry from the database into memory, if there. Keys
+        # changed in memory are not looked up, as they may have been dropped.
+        if key in self.new_keys:
+            return
+        row = self._db.execute(
+            "SELECT value, expires FROM entries WHERE key = ?",
+            (pdumps(key, protocol=KEY_PROTOCOL),)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time()):
+            return
+        self.__store(key, ploads(row[0]), row[1])
+        while len(self.payload) > self.hot_entries:
+            if self.new_keys:
+                self.__write_rows()
+            self.__forget(next(iter(self.payload)))
+
+    def __forget(self, key: Any) -> None:
+        # Drops an entry from memory only, unlike `__drop`.
+        self.payload.pop(key, None)
+        self.expires.pop(key, None)
+        self.hits.pop(key, None)
+        self.nbytes -= self.sizes.pop(key, 0)
+        self.__unshard(key)
+
+    def __write_rows(self) -> None:
+        now = time()
+        rows, gone = [], []
+        for key in self.new_keys:
+            if key in self.payload:
+                rows.append((
+                    pdumps(key, protocol=KEY_PROTOCOL),
+                    pdumps(self.payload[key], protocol=HIGHEST_PROTOCOL),
+                    self.expires.get(key),
+                ))
+            else:
+                gone.append((pdumps(key, protocol=KEY_PROTOCOL),))
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", rows
+            )
+            self._db.executemany("DELETE FROM entries WHERE key = ?", gone)
+            self._db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        self.new_keys.clear()
+
+    def __replay(self) -> None:
+        # Records are counted again, including those still buffered.
+        if self._journal is not None:
+            self._journal.flush()
+        with open(self.path_journal, "rb") as rd:
+            data = rd.read()
+        self._journal_records = 0
+        offset = 0
+        while offset < len(data):
+            try:
+                if self.format == "json":
+                    end = data.index(b"\n", offset) + 1
+                    record = json.loads(data[offset:end])
+                else:
+                    (length,) = struct.unpack_from("<Q", data, offset)
+                    end = offset + 8 + length
+                    if end > len(data):
+                        break
+                    record = ploads(data[offset + 8:end])
+            except (ValueError, struct.error):
+                break
+            for key, val in record.get("set", dict([])).items():
+                self.__store(key, val, record.get("expires"))
+            for key in record.get("del", dict([])):
+                self.__drop(key, log=False)
+            self._journal_records += 1
+            offset = end
+        if offset < len(data):
+            # Drops the incomplete record so that new ones are readable.
+            with open(self.path_journal, "r+b") as wrt:
+                wrt.truncate(offset)
+
+    def __log(self, record: dict) -> None:
+        if self._journal is None:
+            self._journal = open(self.path_journal, "ab")
         if self.format == "json":
-            to_json(self.payload, self.path)
-        elif self.format == "pickle":
-            to_pickle(self.payload, self.path)
+            self._journal.write(json.dumps(record).encode() + b"\n")
         else:
+            encoded = pdumps(record, protocol=HIGHEST_PROTOCOL)
+            self._journal.write(struct.pack("<Q", len(encoded)) + encoded)
+        self._journal_records += 1
+        if self._journal_records > max(len(self.payload), MIN_JOURNAL_RECORDS):
+            self.__snapshot()
+
+    def persist(self):
+        with self._lock:
+            self.__expire()
+            if not self.new_keys:
+                return
+            if self._db is not None:
+                self.__write_rows()
+            elif self.shared:
+                with self.__file_lock(exclusive=True):
+                    self.__merge_files()
+                    self.__snapshot()
+                    self._version = self.__stat()
+            elif self.journal and self._journal_records <= max(
+                len(self.payload), MIN_JOURNAL_RECORDS
+            ):
+                if self._journal is not None:
+                    self._journal.flush()
+            else:
+                self.__snapshot()
+            self.new_keys.clear()
+
+    def close(self, timeout: Optional[float] = SHUTDOWN_TIMEOUT) -> None:
+        """
+        Stops the flusher thread and persists the cache a last time,
+        waiting at most `timeout` seconds for a flush in progress to finish
+        (no limit if None). Called on program exit.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout)
+        if self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            try:
+                self.persist()
+            finally:
+                self._lock.release()
+
+    def __snapshot(self) -> None:
+        if self.format not in SUPPORTED_FORMATS:
             raise ExcludedMiddleViolation(
                 f"got {self.format} but expected {str(SUPPORTED_FORMATS)}"
             )
+        if self._shard_keys:
+            _map_in_threads(
+                self.__write_shard, sorted(self._dirty_shards), self.workers
+            )
+            self._dirty_shards.clear()
+        else:
+            _write_entries(
+                self.payload, self.expires, self.path, self.path_expires,
+                self.format
+            )
+        if self.journal:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self.path_journal.exists():
+                os.remove(self.path_journal)
+            self._journal_records = 0
+
+    def __write_shard(self, idx: int) -> None:
+        # Runs in the threads of `_map_in_threads` while the caller holds
+        # `_lock`, so the entries do not change meanwhile.
+        keys = self._shard_keys[idx]
+        _write_entries(
+            {key: self.payload[key] for key in keys},
+            {key: self.expires[key] for key in keys if key in self.expires},
+            *self.__shard_paths(idx),
+            self.format
+        )
 
     def __del__(self) -> None:
-        if hasattr(self, "format") and (self.payload or self.path.exists()):
+        if hasattr(self, "_flusher"):
+            self._stop.set()
+            self._wake.set()
             self.persist()
 
     def __contains__(self, key: object) -> bool:
-        return key in self.payload
+        with self._lock:
+            self.__refresh_if_changed(key)
+            if self._db is not None and key not in self.payload:
+                self.__fetch(key)
+            return key in self.payload and not self.__drop_if_expired(key)
 
     def __getitem__(self, key: object) -> Any:
-        try:
-            return self.payload[key]
-        except Exception:
-            raise KeyError(key)
+        with self._lock:
+            self.__refresh_if_changed(key)
+            if self._db is not None and key not in self.payload:
+                self.__fetch(key)
+            try:
+                val = self.payload[key]
+            except Exception:
+                raise KeyError(key)
+            if self.__drop_if_expired(key):
+                raise KeyError(key)
+            self.__use(key)
+            return val
     
     def get(self, key: object, default: Any = None) -> Any:
         try:
@@ -94,7 +787,238 @@ class Cachionary:
             return default
 
     def __setitem__(self, key: object, val: object) -> None:
+        self.set(key, val)
+
+    def set(self, key: object, val: object, ttl: Optional[float] = None) -> None:
+        """
+        Parameters
+        ----------
+        key: object
+            Key of the entry.
+
+        val: object
+            Value of the entry.
+
+        ttl: Optional[float]
+            Time to live of this entry, in seconds. Defaults to the time to
+            live of the cache (see the constructor).
+
+        Returns
+        -------
+        Nothing.
+
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time() + ttl
+        with self._lock:
+            self.__store(key, val, expires)
+            self.__changed(key)
+            if self.journal:
+                self.__log({"set": {key: val}, "expires": expires})
+            self.__expire()
+            self.__evict(protected=key)
+            if self._db is not None and len(self.payload) > self.hot_entries:
+                self.__write_rows()
+                while len(self.payload) > self.hot_entries:
+                    self.__forget(next(iter(self.payload)))
+
+    def memoize(self, key: Optional[Callable] = None) -> Callable:
+        """
+        Decorator caching the results of a function in the cachionary, so
+        that they are persisted like any other entry. Concurrent calls with
+        the same key while the result is being computed wait for that
+        computation instead of repeating it (single flight), and get its
+        result or exception. Exceptions are not cached.
+
+        Parameters
+        ----------
+        key: Optional[Callable]
+            Function taking the same arguments as the decorated function and
+            returning the key of the result in the cachionary. By default,
+            the key is the qualified name of the function followed by a hash
+            of the JSON form of its arguments, bound to their parameters (so
+            that `f(1, b=2)` and `f(1, 2)` share a key). Arguments that
+            cannot be turned into JSON are hashed by their `repr`, which
+            must then identify them.
+
+        Returns
+        -------
+        Callable
+            The decorator.
+
+        Examples
+        --------
+        >>> import os
+        >>> cache = Cachionary("cachionary_doctest.json", flush_interval=None)
+        >>> @cache.memoize()
+        ... def square(x):
+        ...     print("computing")
+        ...     return x * x
+        >>> square(3)
+        computing
+        9
+        >>> square(x=3)
+        9
+        >>> cache.persist()
+        >>> os.remove("cachionary_doctest.json")
+
+        """
+        def decorator(func: Callable) -> Callable:
+            signature = inspect.signature(func)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                call_key = (
+                    key(*args, **kwargs) if key is not None
+                    else _call_key(func, signature, args, kwargs)
+                )
+                with self._lock:
+                    val = self.get(call_key, _MISSING)
+                    if val is not _MISSING:
+                        return val
+                    flight = self._flights.get(call_key)
+                    leader = flight is None
+                    if leader:
+                        flight = self._flights[call_key] = Future()
+                if not leader:
+                    return flight.result()
+                try:
+                    val = func(*args, **kwargs)
+                except BaseException as error:
+                    with self._lock:
+                        del self._flights[call_key]
+                    flight.set_exception(error)
+                    raise
+                with self._lock:
+                    self[call_key] = val
+                    del self._flights[call_key]
+                flight.set_result(val)
+                return val
+
+            return wrapper
+
+        return decorator
+
+    def __changed(self, key: Any) -> None:
+        self.new_keys.add(key)
+        if key in self._shard_of:
+            self._dirty_shards.add(self._shard_of[key])
+        if self.flush_every is not None and len(self.new_keys) >= self.flush_every:
+            self._wake.set()
+
+    def __store(
+        self,
+        key: Any,
+        val: Any,
+        expires: Optional[float],
+        shard: Optional[int] = None
+    ) -> None:
+        if key in self.payload:
+            self.nbytes -= self.sizes.pop(key, 0)
         self.payload[key] = val
+        self.payload.move_to_end(key)
+        if expires is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = expires
+            heapq.heappush(
+                self._expirations, (expires, next(self._sequence), key)
+            )
+        if self.max_bytes is not None:
+            self.sizes[key] = _sizeof(key, val)
+            self.nbytes += self.sizes[key]
+        if self._shard_keys and key not in self._shard_of:
+            shard = self.__shard(key) if shard is None else shard
+            self._shard_of[key] = shard
+            self._shard_keys[shard].add(key)
+        self.__use(key)
+
+    def __unshard(self, key: Any) -> None:
+        # The shard of a dropped key is rewritten without it.
+        shard = self._shard_of.pop(key, None)
+        if shard is not None:
+            self._shard_keys[shard].discard(key)
+            self._dirty_shards.add(shard)
+
+    def __use(self, key: Any) -> None:
+        if self.policy == "lru":
+            self.payload.move_to_end(key)
+            return
+        self.hits[key] = self.hits.get(key, 0) + 1
+        if len(self._uses) >= 2 * len(self.payload) + 64:
+            self._uses = [
+                (hits, next(self._sequence), key_)
+                for key_, hits in self.hits.items()
+            ]
+            heapq.heapify(self._uses)
+        else:
+            heapq.heappush(
+                self._uses, (self.hits[key], next(self._sequence), key)
+            )
+
+    def __drop(self, key: Any, log: bool = True) -> None:
+        self.payload.pop(key, None)
+        self.expires.pop(key, None)
+        self.hits.pop(key, None)
+        self.nbytes -= self.sizes.pop(key, 0)
+        self.__unshard(key)
+        # Logged last, as logging may take a snapshot of the entries.
+        if log:
+            self.__changed(key)
+            if self.journal:
+                self.__log({"del": {key: None}})
+
+    def __drop_if_expired(self, key: Any) -> bool:
+        expires = self.expires.get(key)
+        if expires is None or expires > time():
+            return False
+        self.__drop(key)
+        self.n_expired += 1
+        return True
+
+    def __expire(self) -> None:
+        now = time()
+        while self._expirations and self._expirations[0][0] <= now:
+            expires, _, key = heapq.heappop(self._expirations)
+            if self.expires.get(key) == expires:
+                self.__drop(key)
+                self.n_expired += 1
+
+    def __over(self) -> bool:
+        return (
+            self.max_entries is not None and len(self.payload) > self.max_entries
+        ) or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        )
+
+    def __evict(self, protected: Any = None) -> None:
+        # The entry just set is only evicted if it is the last one left.
+        while self.__over():
+            victim = self.__victim(protected)
+            self.__drop(victim)
+            self.n_evicted += 1
+
+    def __victim(self, protected: Any) -> Any:
+        if self.policy == "lru" or len(self.payload) == 1:
+            return next(iter(self.payload))
+        kept = []
+        while True:
+            if not self._uses:
+                self._uses = [
+                    (hits, next(self._sequence), key)
+                    for key, hits in self.hits.items()
+                ]
+                heapq.heapify(self._uses)
+            item = heapq.heappop(self._uses)
+            hits, _, key = item
+            if self.hits.get(key) != hits:
+                continue
+            if key == protected:
+                kept.append(item)
+                continue
+            for item in kept:
+                heapq.heappush(self._uses, item)
+            return key
 
 
 if __name__ == "__main__":
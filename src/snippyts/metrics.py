@@ -1,16 +1,38 @@
 
+from collections.abc import Sequence as SequenceType
 from difflib import SequenceMatcher
 from statistics import mean
+from typing import Any, Sequence, Union
 
 from unidecode import unidecode
-from nltk import wordpunct_tokenize as tokenizer
 
+from .tokenization import Tokenizer, tokenize, wordpunct_tokenize
 
-def average_token_similarity(s1: str, s2: str) -> float:
-    if not (isinstance(s1, str) and isinstance(s2, str)):
+
+def _is_text(text: Any) -> bool:
+    # A string or a sequence of string tokens.
+    if isinstance(text, str):
+        return True
+    return (
+        isinstance(text, SequenceType)
+        and not isinstance(text, (bytes, bytearray))
+        and all(isinstance(token, str) for token in text)
+    )
+
+
+def average_token_similarity(
+    s1: Union[str, Sequence[str]],
+    s2: Union[str, Sequence[str]],
+    tokenizer: Tokenizer = wordpunct_tokenize
+) -> float:
+    if not (_is_text(s1) and _is_text(s2)):
         return 0
-    tokens_0 = [unidecode(token.strip().lower()) for token in tokenizer(s1)]
-    tokens_1 = [unidecode(token.strip().lower()) for token in tokenizer(s2)]
+    tokens_0 = [
+        unidecode(token.strip().lower()) for token in tokenize(s1, tokenizer)
+    ]
+    tokens_1 = [
+        unidecode(token.strip().lower()) for token in tokenize(s2, tokenizer)
+    ]
     tokens_0 = sorted(tokens_0, key=lambda x: len(x), reverse=True)
     tokens_1 = sorted(tokens_1, key=lambda x: len(x), reverse=True)
     
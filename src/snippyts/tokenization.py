@@ -0,0 +1,136 @@
+import re
+from doctest import testmod
+from typing import Callable, Iterator, List, Sequence, Tuple, Union
+
+
+# Same pattern as nltk's `wordpunct_tokenize`: runs of word characters and
+# runs of punctuation, whitespace discarded.
+WORD_PUNCT_PATTERN = r"\w+|[^\w\s]+"
+
+Tokenizer = Callable[[str], List[str]]
+
+
+class RegexTokenizer:
+    """
+    Tokenizer splitting a text into the matches of a regular expression,
+    compiled once when the tokenizer is created. Any callable taking a
+    string and returning a list of strings can be used wherever a tokenizer
+    is expected; this class additionally implements `span_tokenize`, which
+    returns the character offsets of every token.
+
+    Parameters
+    ----------
+    pattern: str
+        Regular expression matching a single token. Defaults to
+        `WORD_PUNCT_PATTERN`, which tokenizes exactly like nltk's
+        `wordpunct_tokenize` without importing nltk.
+
+    Examples
+    --------
+    >>> tokenizer = RegexTokenizer()
+    >>> tokenizer("¿Ok? Esa es la diferencia.")
+    ['¿', 'Ok', '?', 'Esa', 'es', 'la', 'diferencia', '.']
+    >>> list(tokenizer.span_tokenize("¿Ok? Esa"))
+    [(0, 1), (1, 3), (3, 4), (5, 8)]
+    >>> RegexTokenizer(r"\\S+")("¿Ok? Esa es")
+    ['¿Ok?', 'Esa', 'es']
+
+    """
+
+    def __init__(self, pattern: str = WORD_PUNCT_PATTERN) -> None:
+        self.pattern = re.compile(pattern)
+        self.__findall = self.pattern.findall
+
+    def __getstate__(self) -> dict:
+        return {"pattern": self.pattern.pattern}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["pattern"])
+
+    def __call__(self, text: str) -> List[str]:
+        return self.__findall(text)
+
+    def tokenize(self, text: str) -> List[str]:
+        return self.__findall(text)
+
+    def span_tokenize(self, text: str) -> Iterator[Tuple[int, int]]:
+        for match in self.pattern.finditer(text):
+            yield match.span()
+
+
+wordpunct_tokenize = RegexTokenizer()
+
+
+def span_tokenize(
+    text: Union[str, Sequence[str]],
+    tokenizer: Tokenizer = wordpunct_tokenize
+) -> Iterator[Tuple[int, int, str]]:
+    """
+    Yields (start, end, token) triples for every token in `text`.
+
+    Parameters
+    ----------
+    text: Union[str, Sequence[str]]
+        Text to tokenize, or a sequence of tokens. Tokens given in advance
+        are not tokenized again and their offsets are their positions in
+        the sequence (`start` is the index of the token, `end` the next
+        one).
+
+    tokenizer: Tokenizer
+        Callable splitting a string into tokens. If it has no method
+        `span_tokenize` of its own, every token is located in the text
+        right after the previous one, so tokens must be substrings of
+        `text` appearing in order.
+
+    Returns
+    -------
+    Iterator[Tuple[int, int, str]]
+        A generator over the tokens and their offsets.
+
+    Examples
+    --------
+    >>> list(span_tokenize("New York, 1927"))
+    [(0, 3, 'New'), (4, 8, 'York'), (8, 9, ','), (10, 14, '1927')]
+    >>> list(span_tokenize("New York, 1927", str.split))
+    [(0, 3, 'New'), (4, 9, 'York,'), (10, 14, '1927')]
+    >>> list(span_tokenize(["New York", "1927"]))
+    [(0, 1, 'New York'), (1, 2, '1927')]
+
+    """
+    if not isinstance(text, str):
+        for idx, token in enumerate(text):
+            yield idx, idx + 1, token
+        return
+    spans = getattr(tokenizer, "span_tokenize", None)
+    if spans is not None:
+        for start, end in spans(text):
+            yield start, end, text[start:end]
+        return
+    end = 0
+    for token in tokenizer(text):
+        start = text.index(token, end)
+        end = start + len(token)
+        yield start, end, token
+
+
+def tokenize(
+    text: Union[str, Sequence[str]],
+    tokenizer: Tokenizer = wordpunct_tokenize
+) -> Sequence[str]:
+    """
+    Returns the tokens of `text` as split by `tokenizer`, or `text` itself
+    if it is already a sequence of tokens.
+
+    Examples
+    --------
+    >>> tokenize("New York, 1927")
+    ['New', 'York', ',', '1927']
+    >>> tokenize(["New York", "1927"])
+    ['New York', '1927']
+
+    """
+    return tokenizer(text) if isinstance(text, str) else text
+
+
+if __name__ == "__main__":
+    testmod()
@@ -1,18 +1,857 @@
-from collections import defaultdict as deft
+import heapq
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+from collections import defaultdict as deft, deque
+from contextlib import contextmanager
+from copy import copy as shallow_copy
 from doctest import testmod
-from typing import Any, Dict, List, Union
+from functools import lru_cache
+from math import inf, isnan, nan
+from mmap import ACCESS_READ, mmap as memory_map
+from multiprocessing import get_context
+from pathlib import Path
+from pickle import dumps as pdumps, loads as ploads
+from typing import (
+    Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence,
+    Tuple, Union
+)
 
-from nltk import wordpunct_tokenize as tokenize
 from unidecode import unidecode
 from tqdm import tqdm
 
+from .tokenization import Tokenizer, span_tokenize, wordpunct_tokenize
+
+
+SUPPORTED_STORAGES = ["dict", "array"]
+SUPPORTED_SCAN_POLICIES = ["leftmost-longest", "all"]
+
+END = "#"
+SIZE = "#n"
+VALUE = "#v"
+SCORE = "#s"
+BEST = "#b"
+ID = "#i"
+
+MAGIC = b"SNPTRIE1"
+
+SEPARATOR = "\0"
+
+NORMALIZATION_CACHE_SIZE = 2 ** 16
+
+_MISSING = object()
+
+# Tries made available to pool workers by `Trie.search_many`, by token.
+_SHARED_TRIES = dict([])
+
+
+class UnsupportedStorageError(ValueError): ...
+
+class UnsupportedScanPolicyError(ValueError): ...
+
+class UnsupportedTrieFileError(ValueError): ...
+
+class ReadOnlyTrieError(RuntimeError): ...
+
+class InvalidCapacityError(ValueError): ...
+
+class IncompatibleTrieError(ValueError): ...
+
+class TermIdsDisabledError(RuntimeError): ...
+
+
+class Match(NamedTuple):
+    """
+    A term found in a text: `start` and `end` are character offsets into
+    the original text, `term` is the term as stored in the trie and
+    `surface` the form it was originally added with (e.g. 'oración' for the
+    stored term 'oracion') if the trie keeps surface forms, or the term
+    itself otherwise.
+    """
+    start: int
+    end: int
+    term: str
+    surface: str
+
+
+class _DictNodes:
+    """
+    Node storage where every node is a Python dictionary mapping each
+    character to the child node. Terminal nodes hold an `END` key and every
+    node keeps the number of terms below it under key `SIZE`. The value and
+    score of a term and the best score below a node are only stored (under
+    keys `VALUE`, `SCORE` and `BEST`) when set, and so is the integer id of
+    a term (key `ID`). This is the original layout
+    of the trie and the fastest one to query, at the cost of several
+    hundred bytes per node.
+    """
+
+    def __init__(self) -> None:
+        self.root = dict([])
+
+    def child(self, node: Dict, char: str) -> Optional[Dict]:
+        return node.get(char)
+
+    def add_child(self, node: Dict, char: str) -> Dict:
+        child = dict([])
+        node[char] = child
+        return child
+
+    def walk(self, word: str) -> Optional[Dict]:
+        node = self.root
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+    def is_terminal(self, node: Dict) -> bool:
+        return END in node
+
+    def set_terminal(self, node: Dict) -> None:
+        node[END] = True
+
+    def unset_terminal(self, node: Dict) -> None:
+        for key in (END, VALUE, ID):
+            node.pop(key, None)
+
+    def size(self, node: Dict) -> int:
+        return node.get(SIZE, 0)
+
+    def resize(self, node: Dict, delta: int) -> None:
+        node[SIZE] = node.get(SIZE, 0) + delta
+
+    def value(self, node: Dict, default: Any = None) -> Any:
+        return node.get(VALUE, default)
+
+    def set_value(self, node: Dict, value: Any) -> None:
+        node[VALUE] = value
+
+    def term_id(self, node: Dict) -> int:
+        return node.get(ID, -1)
+
+    def set_term_id(self, node: Dict, idx: int) -> None:
+        node[ID] = idx
+
+    def subtree_ids(self, node: Dict, ids: array) -> None:
+        # Appends the ids of the terms below `node` in depth-first order.
+        append = ids.append
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if END in node:
+                append(node[ID])
+            children = [
+                val for key, val in node.items() if len(key) == 1 and key != END
+            ]
+            if children:
+                children.reverse()
+                stack += children
+
+    def score(self, node: Dict) -> Optional[float]:
+        return node.get(SCORE)
+
+    def set_score(self, node: Dict, score: Optional[float]) -> None:
+        if score is None:
+            node.pop(SCORE, None)
+        else:
+            node[SCORE] = score
+
+    def best(self, node: Dict) -> float:
+        return node.get(BEST, -inf)
+
+    def set_best(self, node: Dict, best: float) -> None:
+        node[BEST] = best
+
+    def children(self, node: Dict) -> List[Tuple[str, Dict]]:
+        return [
+            (key, val) for key, val in node.items()
+            if len(key) == 1 and key != END
+        ]
+
+    def entries(self, node: Dict) -> Iterator[Tuple[Optional[str], Any]]:
+        if END in node:
+            yield None, None
+        for key, val in node.items():
+            if len(key) == 1 and key != END:
+                yield key, val
+
+    def redirect(self, node: Dict, char: str, child: Dict) -> None:
+        node[char] = child
+
+    def remove_child(self, node: Dict, char: str) -> None:
+        del node[char]
+
+    def key(self, node: Dict) -> int:
+        return id(node)
+
+    def copy(self) -> Any:
+        # Nodes shared by several parents are copied once.
+        copies = {id(self.root): dict(self.root)}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            new = copies[id(node)]
+            for char, child in self.children(node):
+                if id(child) not in copies:
+                    copies[id(child)] = dict(child)
+                    stack.append(child)
+                new[char] = copies[id(child)]
+        nodes = _DictNodes()
+        nodes.root = copies[id(self.root)]
+        return nodes
+
+    def n_nodes(self) -> int:
+        return sum(1 for _ in self.iter_nodes())
+
+    def nbytes(self) -> int:
+        return sum(sys.getsizeof(node) for node in self.iter_nodes())
+
+    def iter_nodes(self) -> Iterator[Dict]:
+        # Nodes shared by several parents (see `Trie.minimize`) are visited
+        # only once.
+        seen = set([id(self.root)])
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            for _, child in self.children(node):
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+
+
+class _ArrayNodes:
+    """
+    Node storage holding the whole trie in six flat arrays of machine
+    integers. Nodes are integer offsets (the root is node 0) and each
+    node owns a linked list of outgoing edges kept in insertion order:
+
+    - `first[node]`: first outgoing edge of `node` (0 if none),
+    - `final[node]`: 1 if `node` closes a term, 0 otherwise,
+    - `sizes[node]`: number of terms in the subtree rooted at `node`,
+    - `label[edge]`: code point of the character on `edge`,
+    - `target[edge]`: node `edge` points to,
+    - `next[edge]`: next edge leaving the same node (0 if none).
+
+    Edge 0 is a sentinel so that 0 can be used as the null pointer. A node
+    costs 21 bytes on average (9 bytes of node data plus one 12-byte
+    incoming edge) instead of a dictionary per node.
+
+    Two columns of floats, `scores[node]` (NaN if unset) and
+    `best_scores[node]` (best score in the subtree rooted at `node`), are only allocated once a first term is
+    given a score. Likewise, column `ids[node]` (-1 if unset) holds the
+    integer ids of the terms once a first term is given one. Values of terms
+    are kept in dictionary `values`.
+
+    Removing a child unlinks its edge but leaves the nodes below it in the
+    arrays; their number is kept in `n_dead` so that the trie can be
+    compacted (see `Trie.remove`).
+
+    The same columns are the on-disk layout written by `Trie.save`, so a
+    saved trie can be searched straight from a read-only memory map. Such
+    mapped storages are pickled by path and mapped again when unpickled.
+    """
+
+    COLUMNS = ("first", "final", "sizes", "label", "target", "next")
+    SCORE_COLUMNS = ("scores", "best_scores")
+    ID_COLUMNS = ("ids",)
+
+    def __init__(self) -> None:
+        self.root = 0
+        self.first = array("I", [0])
+        self.final = bytearray(1)
+        self.sizes = array("I", [0])
+        self.label = array("I", [0])
+        self.target = array("I", [0])
+        self.next = array("I", [0])
+        self.scores = None
+        self.best_scores = None
+        self.ids = None
+        self.values = dict([])
+        self.n_dead = 0
+        self.source = None
+
+    def columns(self) -> List[str]:
+        columns = list(self.COLUMNS)
+        if self.scores is not None:
+            columns.extend(self.SCORE_COLUMNS)
+        if self.ids is not None:
+            columns.extend(self.ID_COLUMNS)
+        return columns
+
+    def __append_node(self) -> int:
+        node = len(self.first)
+        self.first.append(0)
+        self.final.append(0)
+        self.sizes.append(0)
+        if self.scores is not None:
+            self.scores.append(nan)
+            self.best_scores.append(-inf)
+        if self.ids is not None:
+            self.ids.append(-1)
+        return node
+
+    @classmethod
+    def from_nodes(cls, nodes: Any) -> Any:
+        # Nodes reachable from several parents are copied once, so that
+        # minimized tries stay minimized; unreachable nodes are dropped.
+        copy = cls()
+        copies = {nodes.key(nodes.root): 0}
+        queue = deque([nodes.root])
+        while queue:
+            node = queue.popleft()
+            new = copies[nodes.key(node)]
+            copy.final[new] = nodes.is_terminal(node)
+            copy.sizes[new] = nodes.size(node)
+            if nodes.score(node) is not None:
+                copy.set_score(new, nodes.score(node))
+            if nodes.best(node) > -inf:
+                copy.set_best(new, nodes.best(node))
+            if nodes.term_id(node) >= 0:
+                copy.set_term_id(new, nodes.term_id(node))
+            value = nodes.value(node, _MISSING)
+            if value is not _MISSING:
+                copy.values[new] = value
+            last = 0
+            for char, child in nodes.children(node):
+                copied = copies.get(nodes.key(child))
+                if copied is None:
+                    copied = copy.__append_node()
+                    copies[nodes.key(child)] = copied
+                    queue.append(child)
+                edge = len(copy.label)
+                copy.label.append(ord(char))
+                copy.target.append(copied)
+                copy.next.append(0)
+                if last:
+                    copy.next[last] = edge
+                else:
+                    copy.first[new] = edge
+                last = edge
+        return copy
+
+    @classmethod
+    def from_file(
+        cls,
+        path: Path,
+        columns: Dict[str, List[Any]],
+        values: List[int],
+        mmap: bool
+    ) -> Any:
+        nodes = cls()
+        if mmap:
+            with open(path, "rb") as rd:
+                buffer = memoryview(memory_map(rd.fileno(), 0, access=ACCESS_READ))
+            nodes.source = path
+        else:
+            with open(path, "rb") as rd:
+                buffer = memoryview(rd.read())
+        for name, (offset, typecode, length) in columns.items():
+            view = buffer[offset:offset + length * array(typecode).itemsize]
+            if mmap:
+                column = view.cast(typecode)
+            elif typecode == "B":
+                column = bytearray(view)
+            else:
+                column = array(typecode, view.tobytes())
+            setattr(nodes, name, column)
+        offset, length = values
+        nodes.values = ploads(buffer[offset:offset + length])
+        return nodes
+
+    def __getstate__(self) -> Dict[str, Any]:
+        if self.source is not None:
+            return {"source": self.source}
+        return self.__dict__
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if set(state) == {"source"}:
+            header, columns = _read_header(state["source"])
+            state = _ArrayNodes.from_file(
+                state["source"], columns, header["values"], True
+            ).__dict__
+        self.__dict__.update(state)
+
+    def child(self, node: int, char: str) -> Optional[int]:
+        code = ord(char)
+        label = self.label
+        nxt = self.next
+        edge = self.first[node]
+        while edge and label[edge] != code:
+            edge = nxt[edge]
+        return self.target[edge] if edge else None
+
+    def add_child(self, node: int, char: str) -> int:
+        child = self.__append_node()
+        edge = len(self.label)
+        self.label.append(ord(char))
+        self.target.append(child)
+        self.next.append(0)
+        last = self.first[node]
+        if not last:
+            self.first[node] = edge
+        else:
+            while self.next[last]:
+                last = self.next[last]
+            self.next[last] = edge
+        return child
+
+    def walk(self, word: str) -> Optional[int]:
+        first, label, target, nxt = self.first, self.label, self.target, self.next
+        node = 0
+        for char in word:
+            code = ord(char)
+            edge = first[node]
+            while edge and label[edge] != code:
+                edge = nxt[edge]
+            if not edge:
+                return None
+            node = target[edge]
+        return node
+
+    def is_terminal(self, node: int) -> bool:
+        return bool(self.final[node])
+
+    def set_terminal(self, node: int) -> None:
+        self.final[node] = 1
+
+    def unset_terminal(self, node: int) -> None:
+        self.final[node] = 0
+        self.values.pop(node, None)
+        if self.ids is not None:
+            self.ids[node] = -1
+
+    def size(self, node: int) -> int:
+        return self.sizes[node]
+
+    def resize(self, node: int, delta: int) -> None:
+        self.sizes[node] += delta
+
+    def value(self, node: int, default: Any = None) -> Any:
+        return self.values.get(node, default)
+
+    def set_value(self, node: int, value: Any) -> None:
+        self.values[node] = value
+
+    def term_id(self, node: int) -> int:
+        return -1 if self.ids is None else self.ids[node]
+
+    def set_term_id(self, node: int, idx: int) -> None:
+        if self.ids is None:
+            self.ids = array("q", [-1]) * len(self.first)
+        self.ids[node] = idx
+
+    def subtree_ids(self, node: int, ids: array) -> None:
+        # Appends the ids of the terms below `node` in depth-first order.
+        first, final, target, nxt = self.first, self.final, self.target, self.next
+        term_ids = self.ids
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if final[node]:
+                ids.append(term_ids[node])
+            edge = first[node]
+            if not edge:
+                continue
+            children = []
+            while edge:
+                children.append(target[edge])
+                edge = nxt[edge]
+            children.reverse()
+            stack += children
+
+    def score(self, node: int) -> Optional[float]:
+        if self.scores is None or isnan(self.scores[node]):
+            return None
+        return self.scores[node]
+
+    def set_score(self, node: int, score: Optional[float]) -> None:
+        self.__allocate_scores()
+        self.scores[node] = nan if score is None else score
+
+    def best(self, node: int) -> float:
+        return -inf if self.best_scores is None else self.best_scores[node]
+
+    def set_best(self, node: int, best: float) -> None:
+        self.__allocate_scores()
+        self.best_scores[node] = best
+
+    def __allocate_scores(self) -> None:
+        if self.scores is None:
+            self.scores = array("d", [nan]) * len(self.first)
+            self.best_scores = array("d", [-inf]) * len(self.first)
+
+    def children(self, node: int) -> List[Tuple[str, int]]:
+        children = []
+        edge = self.first[node]
+        while edge:
+            children.append((chr(self.label[edge]), self.target[edge]))
+            edge = self.next[edge]
+        return children
+
+    def entries(self, node: int) -> Iterator[Tuple[Optional[str], Any]]:
+        if self.final[node]:
+            yield None, None
+        edge = self.first[node]
+        while edge:
+            yield chr(self.label[edge]), self.target[edge]
+            edge = self.next[edge]
+
+    def redirect(self, node: int, char: str, child: int) -> None:
+        code = ord(char)
+        edge = self.first[node]
+        while self.label[edge] != code:
+            edge = self.next[edge]
+        self.target[edge] = child
+
+    def remove_child(self, node: int, char: str) -> None:
+        code = ord(char)
+        previous, edge = 0, self.first[node]
+        while self.label[edge] != code:
+            previous, edge = edge, self.next[edge]
+        if previous:
+            self.next[previous] = self.next[edge]
+        else:
+            self.first[node] = self.next[edge]
+        stack = [self.target[edge]]
+        while stack:
+            self.n_dead += 1
+            stack.extend(child for _, child in self.children(stack.pop()))
+
+    def key(self, node: int) -> int:
+        return node
+
+    def absorb(self, other: Any, id_offset: int = 0) -> None:
+        # Appends all nodes and edges of `other` but its root, shifting the
+        # offsets they hold and its term ids by `id_offset`, and links the
+        # children of its root to this root. Both roots must not have any
+        # child in common.
+        nodes, edges = len(self.first) - 1, len(self.label) - 1
+        if self.ids is not None or other.ids is not None:
+            if self.ids is None:
+                self.ids = array("q", [-1]) * len(self.first)
+            if other.ids is None:
+                self.ids.extend(array("q", [-1]) * (len(other.first) - 1))
+            else:
+                self.ids.extend(array("q", [
+                    idx + id_offset if idx >= 0 else -1
+                    for idx in other.ids[1:]
+                ]))
+        if self.scores is not None or other.scores is not None:
+            self.__allocate_scores()
+            if other.scores is None:
+                self.scores.extend(array("d", [nan]) * (len(other.first) - 1))
+                self.best_scores.extend(
+                    array("d", [-inf]) * (len(other.first) - 1)
+                )
+            else:
+                self.scores.extend(other.scores[1:])
+                self.best_scores.extend(other.best_scores[1:])
+                self.best_scores[0] = max(
+                    self.best_scores[0], other.best_scores[0]
+                )
+        self.first.extend(
+            array("I", [edge + edges if edge else 0 for edge in other.first[1:]])
+        )
+        self.final.extend(other.final[1:])
+        self.sizes.extend(other.sizes[1:])
+        self.label.extend(other.label[1:])
+        self.target.extend(array("I", [node + nodes for node in other.target[1:]]))
+        self.next.extend(
+            array("I", [edge + edges if edge else 0 for edge in other.next[1:]])
+        )
+        self.values.update(
+            (node + nodes, value) for node, value in other.values.items()
+        )
+        self.sizes[0] += other.sizes[0]
+        self.n_dead += other.n_dead
+        if other.first[0]:
+            last = self.first[0]
+            while last and self.next[last]:
+                last = self.next[last]
+            if last:
+                self.next[last] = other.first[0] + edges
+            else:
+                self.first[0] = other.first[0] + edges
+
+    def copy(self) -> Any:
+        # Columns are copied in bulk, including memory-mapped ones.
+        nodes = _ArrayNodes()
+        for name in self.columns():
+            column = getattr(self, name)
+            if isinstance(column, memoryview):
+                column = (
+                    bytearray(column) if column.format == "B"
+                    else array(column.format, column.tobytes())
+                )
+            else:
+                column = column[:]
+            setattr(nodes, name, column)
+        nodes.values = dict(self.values)
+        nodes.n_dead = self.n_dead
+        return nodes
+
+    def n_nodes(self) -> int:
+        return len(self.first) - self.n_dead
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.values) + sum(
+            sys.getsizeof(getattr(self, column)) for column in self.columns()
+        )
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def _normalize(word: str, case_sensitive: bool, decode_ascii: bool) -> str:
+    # Bounded cache for the normalization of queries, which tend to repeat
+    # far more than the terms being added.
+    word = word.lower() if not case_sensitive else word
+    if decode_ascii and not word.isascii():
+        word = unidecode(word)
+    return word
+
+
+def _install_trie(token: str, trie: Any) -> None:
+    _SHARED_TRIES[token] = trie
+
+
+def _search_chunk(token: str, chunk: List[str]) -> List[List[str]]:
+    trie = _SHARED_TRIES[token]
+    return [trie.search(doc) for doc in chunk]
+
+
+def _build_shard(options: Dict[str, Any]) -> Any:
+    return Trie.from_iterable(**options)
+
+
+def _compile_pattern(pattern: str) -> List[Tuple[Any, ...]]:
+    # Parses a shell-style pattern into a list of tokens: ("*",) for any
+    # sequence of characters, ("?",) for any character, ("=", char) for a
+    # literal and ("[", chars, ranges, negated) for a character class.
+    tokens = []
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        idx += 1
+        if char == "*":
+            if not tokens or tokens[-1] != ("*",):
+                tokens.append(("*",))
+        elif char == "?":
+            tokens.append(("?",))
+        elif char == "[":
+            # As in `fnmatch`, a "]" right after "[" or "[!" is a member of
+            # the class, and a "[" without a closing "]" is a literal.
+            end = idx
+            if end < len(pattern) and pattern[end] == "!":
+                end += 1
+            if end < len(pattern) and pattern[end] == "]":
+                end += 1
+            while end < len(pattern) and pattern[end] != "]":
+                end += 1
+            if end >= len(pattern):
+                tokens.append(("=", char))
+                continue
+            body = pattern[idx:end]
+            negated = body.startswith("!")
+            body = body[negated:]
+            chars, ranges = set([]), []
+            pos = 0
+            while pos < len(body):
+                if pos + 2 < len(body) and body[pos + 1] == "-":
+                    ranges.append((body[pos], body[pos + 2]))
+                    pos += 3
+                else:
+                    chars.add(body[pos])
+                    pos += 1
+            tokens.append(("[", frozenset(chars), tuple(ranges), negated))
+            idx = end + 1
+        else:
+            tokens.append(("=", char))
+    return tokens
+
+
+def _accepts(token: Tuple[Any, ...], char: str) -> bool:
+    kind = token[0]
+    if kind == "=":
+        return token[1] == char
+    if kind == "?":
+        return True
+    _, chars, ranges, negated = token
+    found = char in chars or any(low <= char <= high for low, high in ranges)
+    return found != negated
+
+
+def _file_mode(path: Path) -> int:
+    # Mode of the file at `path`, or the mode `open` would give a new file.
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _read_header(path: Path) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+    with open(path, "rb") as rd:
+        magic = rd.read(len(MAGIC))
+        if magic != MAGIC:
+            raise UnsupportedTrieFileError(f"{path} is not a saved Trie")
+        (length,) = struct.unpack("<Q", rd.read(8))
+        header = json.loads(rd.read(length))
+    if header["byteorder"] != sys.byteorder:
+        raise UnsupportedTrieFileError(
+            f"{path} was saved on a {header['byteorder']}-endian machine"
+        )
+    # Offsets are stored relative to the end of the header.
+    columns = header.pop("columns")
+    for column in columns.values():
+        column[0] += len(MAGIC) + 8 + length
+    header["values"][0] += len(MAGIC) + 8 + length
+    header["surfaces"][0] += len(MAGIC) + 8 + length
+    return header, columns
+
+
+class _Automaton:
+    """
+    Aho-Corasick automaton compiled from the nodes of a trie. States are
+    numbered in breadth-first order and hold:
+
+    - `goto[state]`: dictionary from character to next state,
+    - `fail[state]`: state for the longest proper suffix that is also a
+      prefix of some term,
+    - `depth[state]`: length of the term if `state` closes one, else 0,
+    - `link[state]`: nearest terminal state along the failure links (0 if
+      none), so that all terms ending at a position are enumerated in
+      time proportional to their number.
+    """
+
+    def __init__(self, nodes: Any) -> None:
+        self.goto = [dict([])]
+        self.fail = array("I", [0])
+        self.depth = array("I", [0])
+        self.link = array("I", [0])
+        lengths = [0]
+        queue = deque([(nodes.root, 0)])
+        while queue:
+            node, state = queue.popleft()
+            for char, child in nodes.children(node):
+                new = len(self.goto)
+                self.goto.append(dict([]))
+                self.goto[state][char] = new
+                fail = 0
+                if state:
+                    fail = self.fail[state]
+                    while fail and char not in self.goto[fail]:
+                        fail = self.fail[fail]
+                    fail = self.goto[fail].get(char, 0)
+                lengths.append(lengths[state] + 1)
+                self.fail.append(fail)
+                self.depth.append(
+                    lengths[-1] if nodes.is_terminal(child) else 0
+                )
+                self.link.append(fail if self.depth[fail] else self.link[fail])
+                queue.append((child, new))
+
+    def __call__(self, stream: str) -> Iterator[Tuple[int, int]]:
+        goto, fail, depth, link = self.goto, self.fail, self.depth, self.link
+        state = 0
+        for end, char in enumerate(stream, 1):
+            while True:
+                nxt = goto[state].get(char)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            hit = state if depth[state] else link[state]
+            while hit:
+                yield end - depth[hit], end
+                hit = link[hit]
+
+
+class _SuffixArray:
+    """
+    Generalized suffix array over the terms of a trie:
+
+    - `text`: all terms in lexicographic order, each followed by
+      `SEPARATOR`,
+    - `starts[term]`: offset of the `term`-th term in `text`,
+    - `suffixes`: offsets in `text` of every suffix of every term, sorted by
+      the suffix up to the end of its term.
+
+    The terms containing a string are those owning the contiguous range of
+    suffixes starting with it, which is found by binary search. Suffixes
+    are sorted one bucket (of suffixes sharing their first character) at a
+    time, so that only the sort keys of a bucket are held in memory at once.
+    """
+
+    def __init__(self, terms: Iterable[str]) -> None:
+        self.starts = array("I", [])
+        buckets = deft(lambda: array("I", []))
+        offset = 0
+        chunks = []
+        for term in terms:
+            self.starts.append(offset)
+            for idx, char in enumerate(term):
+                buckets[char].append(offset + idx)
+            chunks.append(term)
+            offset += len(term) + 1
+        self.starts.append(offset)
+        self.text = SEPARATOR.join(chunks) + SEPARATOR
+        text = self.text
+        self.suffixes = array("I", [])
+        for char in sorted(buckets):
+            self.suffixes.extend(sorted(
+                buckets.pop(char),
+                key=lambda start: text[start:text.index(SEPARATOR, start)]
+            ))
+
+    def __call__(self, query: str, limit: Optional[int]) -> List[str]:
+        text, suffixes, starts = self.text, self.suffixes, self.starts
+        width = len(query)
+        # As `query` has no separator and the separator sorts first, the
+        # slices of `width` characters are ordered like the suffixes.
+        low, high = 0, len(suffixes)
+        while low < high:
+            mid = (low + high) // 2
+            start = suffixes[mid]
+            if text[start:start + width] < query:
+                low = mid + 1
+            else:
+                high = mid
+        found = set([])
+        terms = []
+        for idx in range(low, len(suffixes)):
+            if len(terms) == limit:
+                break
+            start = suffixes[idx]
+            if text[start:start + width] != query:
+                break
+            term = bisect_right(starts, start) - 1
+            if term not in found:
+                found.add(term)
+                terms.append(text[starts[term]:starts[term + 1] - 1])
+        return terms
+
 
 class Trie:
 
     def __init__(
         self,
         case_sensitive: bool = False,
-        decode_ascii: bool = True
+        decode_ascii: bool = True,
+        storage: str = "dict",       # SUPPORTED_STORAGES
+        tokenizer: Tokenizer = wordpunct_tokenize,
+        counting: bool = False,
+        capacity: Optional[int] = None,
+        term_ids: bool = False,
+        keep_surfaces: bool = False
     ) -> None:
         """
         Constructor for an instance of a trie that allows for very fast exact
@@ -32,9 +871,57 @@ class Trie:
         decode_ascii: bool
             If set to false, non-ASCII strings are first decoded into ASCII strings
             are then added to the Trie. The Trie will thus return matches for the
-            ASCII strings, not the original ones. No mapping between both encodings
-            is kept inside the Trie and it should be implemented if needed.
+            ASCII strings, not the original ones. The original forms of the
+            terms can be kept with argument `keep_surfaces`.
 
+        storage: str
+            Node storage engine, one of `SUPPORTED_STORAGES`. With "dict"
+            (default) every node is a Python dictionary, which is the
+            fastest option for look-up. With "array" all nodes are held in
+            a few flat integer arrays, which takes about 8 times less
+            memory per term (see method `bytes_per_term`)
+            and is the layout of choice for large vocabularies.
+
+        tokenizer: Tokenizer
+            Callable splitting the texts passed to method `search` into
+            tokens (see module `snippyts.tokenization`). Defaults to a
+            precompiled regular expression equivalent to nltk's
+            `wordpunct_tokenize`. It must be picklable for method
+            `search_many` to use it on other processes, and it is not saved
+            by method `save`.
+
+        counting: bool
+            If set to true, the trie counts its terms: every call to `add`
+            increments the count of the term, kept as its score, instead of
+            setting it. Counts are read with methods `frequency`, `total`
+            and `most_common`.
+
+        capacity: Optional[int]
+            Maximum number of terms of a counting trie. Once it is reached,
+            adding a new term evicts the term with the lowest count and the
+            new term inherits that count (the Space-Saving algorithm), so
+            memory stays bounded over unbounded streams: every term counted
+            more than `1 / capacity` of the time is kept, and counts are
+            overestimated by at most the count of the evicted term. No limit
+            by default. Only supported with `counting`.
+
+        term_ids: bool
+            If set to true, every term is given an integer id when it is
+            added (0, 1, 2, ... in order of addition). A term keeps its id
+            until it is removed, and ids of removed terms are not reused.
+            Methods `search` and `scan` can then return compact arrays of
+            ids instead of lists of strings (argument `ids`), method
+            `search_counts` counts matches per id, and ids are mapped back
+            to terms with method `id_to_term`.
+
+        keep_surfaces: bool
+            If set to true, the form every term was first added with is kept
+            whenever it differs from the normalized term (e.g. 'Oración' for
+            'oracion'), and returned along with the matches by passing
+            `spans=True` to methods `search` and `scan`. Surface forms are
+            kept in a table by term, apart from the nodes, so they take
+            memory per term but do not keep method `minimize` from merging
+            nodes. Off by default.
 
         Examples
         --------
@@ -78,10 +965,88 @@ class Trie:
         >>> assert trie("oración") == ['oración']
         >>> assert trie.search("oració") == ['oración']
 
+        >>> trie = Trie(storage="array")
+        >>> trie += [
+        ...    "orca", "Orco", "orco", "oro",
+        ...    "orwelliano", "oráculo", "oración",
+        ... ]
+        >>> assert trie.search("ora") == ['oraculo', 'oracion']
+        >>> assert trie('orco') == ['orco']
+        >>> assert 'oro' in trie
+        >>> assert 'or' not in trie
+
         """
+        if storage not in SUPPORTED_STORAGES:
+            raise UnsupportedStorageError(
+                f"got {storage} but expected {str(SUPPORTED_STORAGES)}"
+            )
+        if capacity is not None and capacity < 1:
+            raise InvalidCapacityError(f"got {capacity} but expected at least 1")
+        if capacity is not None and not counting:
+            raise InvalidCapacityError("capacity requires counting=True")
         self.case_sensitive = case_sensitive
         self.decode_ascii = decode_ascii
-        self._tree = dict([])
+        self.storage = storage
+        self.tokenizer = tokenizer
+        self.counting = counting
+        self.capacity = capacity
+        self.term_ids = term_ids
+        self.keep_surfaces = keep_surfaces
+        self._nodes = _DictNodes() if storage == "dict" else _ArrayNodes()
+        self._n_terms = 0
+        self._automaton = None
+        self._substrings = None
+        self._readonly = False
+        # Minimized tries share nodes between terms and stay read-only
+        # through `save`, `open` and `copy`.
+        self._minimized = False
+        # (count, term) pairs of a counting trie with a capacity, used to
+        # find the term to evict. Stale pairs are skipped when popped.
+        self._heap = []
+        # Number of term ids given so far and the term of every id (None
+        # once removed). The list is rebuilt from the nodes on demand when
+        # set to None.
+        self._n_ids = 0
+        self._terms = []
+        # Surface forms of the terms, if `keep_surfaces`, by term.
+        self._surfaces = dict([])
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Tries pickled before storage engines were introduced only hold
+        # the nested dictionary in attribute `_tree`.
+        tree = state.pop("_tree", None)
+        state.setdefault("_automaton", None)
+        state.setdefault("_substrings", None)
+        state.setdefault("_readonly", False)
+        state.setdefault("_minimized", False)
+        state.setdefault("tokenizer", wordpunct_tokenize)
+        state.setdefault("counting", False)
+        state.setdefault("capacity", None)
+        state.setdefault("_heap", [])
+        state.setdefault("term_ids", False)
+        state.setdefault("_n_ids", 0)
+        state.setdefault("_terms", [])
+        state.setdefault("keep_surfaces", False)
+        state.setdefault("_surfaces", dict([]))
+        self.__dict__.update(state)
+        if tree is not None:
+            self._nodes = _DictNodes()
+            self._nodes.root = tree
+            self.storage = "dict"
+            self._n_terms = self.__recount()
+
+    def __recount(self) -> int:
+        # Rebuilds the subtree sizes bottom-up and returns the number of terms.
+        nodes = self._nodes
+        order = [nodes.root]
+        for node in order:
+            order.extend(child for _, child in nodes.children(node))
+        for node in reversed(order):
+            size = int(nodes.is_terminal(node)) + sum(
+                nodes.size(child) for _, child in nodes.children(node)
+            )
+            nodes.resize(node, size - nodes.size(node))
+        return nodes.size(nodes.root)
 
     def __iadd__(self, words: List[str]) -> Any:
         """
@@ -101,145 +1066,2119 @@ class Trie:
             self.add(word)
         return self
 
-    def __preprocess_word(self, word: str) -> str:
-        word = word.lower() if not self.case_sensitive else word
-        if self.decode_ascii:
-            word = unidecode(word)
-        return word
-
-    def add(self, word: str) -> None:
+    def __isub__(self, words: List[str]) -> Any:
         """
         Parameters
         ----------
-        word: str
-            New term to be added to the trie.
+        word: List[str]
+            A wrapper around the `remove` method that supports
+            iterable objects as input, for convenience.
 
         Returns
         -------
-        Nothing.
+        snippyts.Trie
+            The same object the method has been called on.
 
         """
-        word = self.__preprocess_word(word)
-        parts = list(word)
-        tree = self._tree
-        while parts:
-            part = parts.pop(0)
-            if part not in tree:
-                tree[part] = dict([])
-            tree = tree[part]
-            if not parts:
-                tree["#"] = True
+        for word in words:
+            self.remove(word)
+        return self
 
-    def __contains__(self, word: str) -> bool:
+    def __len__(self) -> int:
         """
-        Parameters
-        ----------
-        word: str
-            A string of arbitrary length to look up on the trie.
-
         Returns
         -------
-        bool
-            True if the trie contains the value denoted by the input
-            argument, and False otherwise.
+        int
+            Number of terms in the trie, kept as a counter so that the call
+            does not depend on the size of the trie.
 
-            A full match is required (over all the characters in the input
-            string), otherwise no matches are returned and none are assumed
-            to exist.
+        """
+        return self._n_terms
 
-            Note that this method is a wrapper around the class's call.
+    def __preprocess_word(self, word: str) -> str:
+        word = word.lower() if not self.case_sensitive else word
+        if self.decode_ascii:
+            word = unidecode(word)
+        return word
 
-            To get matches for partial strings, use method `search` instead.
-        """
-        return True if self(word) else False
+    def __preprocess_query(self, word: str) -> str:
+        return _normalize(word, self.case_sensitive, self.decode_ascii)
+
+    def __preprocess_words(self, words: List[str]) -> List[str]:
+        # Normalizes a batch of words with a single call to `lower` and
+        # `unidecode` over their concatenation, which is much faster than
+        # one call per word. Batches where the separator cannot be used
+        # safely are normalized word by word instead.
+        joined = "\n".join(words)
+        joined = joined.lower() if not self.case_sensitive else joined
+        if self.decode_ascii:
+            joined = unidecode(joined)
+        normalized = joined.split("\n")
+        if len(normalized) != len(words):
+            return [self.__preprocess_word(word) for word in words]
+        return normalized
 
-    def search(self, text: str) -> List[str]:
+    @classmethod
+    def from_iterable(
+        cls,
+        words: Iterable[str],
+        presorted: bool = False,
+        minimize: bool = False,
+        batch_size: int = 10000,
+        case_sensitive: bool = False,
+        decode_ascii: bool = True,
+        storage: str = "dict",       # SUPPORTED_STORAGES
+        tokenizer: Tokenizer = wordpunct_tokenize,
+        n_workers: int = 1,
+        term_ids: bool = False,
+        keep_surfaces: bool = False
+    ) -> Any:
         """
+        Builds a trie from a collection of words in bulk. Words are
+        normalized in batches and inserted in sorted order in a single pass:
+        every word only creates the nodes for the part it does not share
+        with the previous word, without looking up any existing node, so
+        build time grows linearly with the total length of the input.
+
         Parameters
         ----------
-        word: str
-            A string of arbitrary length to look up on the trie.
+        words: Iterable[str]
+            The terms to add to the trie.
 
-            The value can denote both a partial string or a full string.
-            Regardless, method `search` will return all matches of that
-            string, including longer terms the matching string is a substring
-            of. To force full matches, call the class itself, or invoke its
-            `contains` method.
+        presorted: bool
+            If true, `words` is assumed to be sorted once normalized and is
+            consumed as a stream, in batches of `batch_size` words, without
+            holding it in memory. Words found out of order are still added,
+            just not on the fast path. If false (default), all words are
+            normalized and sorted first.
+
+        minimize: bool
+            If true, the trie is minimized into a directed acyclic word
+            graph after it is built (see method `minimize`).
+
+        batch_size: int
+            Number of words normalized at once.
+
+        case_sensitive: bool
+            See the constructor.
+
+        decode_ascii: bool
+            See the constructor.
+
+        storage: str
+            See the constructor.
+
+        tokenizer: Tokenizer
+            See the constructor.
+
+        n_workers: int
+            If greater than 1, words are split into shards by their first
+            character (contiguous ranges of characters, balanced by number
+            of words), each shard is built on a pool of `n_workers` worker
+            processes and the resulting tries are merged (see method
+            `merge`). Shards do not share any prefix, so merging them is
+            cheap and most of the work, normalization included, runs in
+            parallel. Words are held in memory to be split, even if
+            `presorted` is true.
+
+        term_ids: bool
+            See the constructor. Ids are given in sorted order of the terms,
+            unless `presorted` is true, where they follow the input.
+
+        keep_surfaces: bool
+            See the constructor. The surface form kept for a term given in
+            several forms is the first one in the input.
 
         Returns
         -------
-        List[str]
-            A list with all the strings matching the input substring provided
-            as the value of argument `word`.
+        snippyts.Trie
+            The new trie.
+
+        Examples
+        --------
+        >>> trie = Trie.from_iterable([
+        ...    "orca", "Orco", "orco", "oro",
+        ...    "orwelliano", "oráculo", "oración",
+        ... ])
+        >>> assert trie.search("ora") == ['oracion', 'oraculo']
+        >>> assert trie.count("or") == 6
+        >>> trie = Trie.from_iterable(["orca", "orco", "oro"], presorted=True)
+        >>> assert trie('oro') == ['oro']
 
         """
-        matches = []
-        for word in tokenize(text):
-            word = self.__preprocess_word(word)
-            matches.extend(self.__lookup(
-                word, self._tree, [], list(word), []
+        if n_workers > 1:
+            return cls.__build_sharded(words, n_workers, minimize, dict(
+                presorted=presorted,
+                batch_size=batch_size,
+                case_sensitive=case_sensitive,
+                decode_ascii=decode_ascii,
+                storage=storage,
+                tokenizer=tokenizer,
+                term_ids=term_ids,
+                keep_surfaces=keep_surfaces,
             ))
-        return matches
+        trie = cls(
+            case_sensitive=case_sensitive,
+            decode_ascii=decode_ascii,
+            storage=storage,
+            tokenizer=tokenizer,
+            term_ids=term_ids,
+            keep_surfaces=keep_surfaces
+        )
+        if presorted:
+            batches = trie.__batches(words, batch_size)
+        else:
+            # The first form a term is given in is kept as its surface form.
+            surfaces = dict([])
+            for batch in trie.__batches(words, batch_size):
+                for word, surface in batch:
+                    surfaces.setdefault(word, surface)
+            batches = [sorted(surfaces.items())]
 
-    def __call__(self, word: str) -> List[str]:
+        # `path` holds the nodes spelling the previous word and `entered`
+        # the number of words added when each of them was created, so that
+        # the size of a node is known as soon as the walk leaves it.
+        nodes = trie._nodes
+        path, entered = [nodes.root], [0]
+        previous = ""
+        added = 0
+        for batch in batches:
+            for word, surface in batch:
+                if not word or word == previous:
+                    continue
+                if word < previous:
+                    trie.__insert(word, surface)
+                    continue
+                common = 0
+                for char_0, char_1 in zip(previous, word):
+                    if char_0 != char_1:
+                        break
+                    common += 1
+                for node, since in zip(path[common + 1:], entered[common + 1:]):
+                    nodes.resize(node, added - since)
+                del path[common + 1:]
+                del entered[common + 1:]
+                node = path[-1]
+                for char in word[common:]:
+                    node = nodes.add_child(node, char)
+                    path.append(node)
+                    entered.append(added)
+                nodes.set_terminal(node)
+                if keep_surfaces and surface != word:
+                    trie._surfaces[word] = surface
+                if term_ids:
+                    trie.__assign_id(node, word)
+                added += 1
+                previous = word
+        for node, since in zip(path, entered):
+            nodes.resize(node, added - since)
+        trie._n_terms += added
+
+        if minimize:
+            trie.minimize()
+        return trie
+
+    @classmethod
+    def __build_sharded(
+        cls,
+        words: Iterable[str],
+        n_workers: int,
+        minimize: bool,
+        options: Dict[str, Any]
+    ) -> Any:
+        # Words are grouped by their normalized first character, and groups
+        # are split into shards of consecutive characters, so that shards
+        # merged in order keep the children of the root sorted.
+        case_sensitive = options["case_sensitive"]
+        decode_ascii = options["decode_ascii"]
+        groups = deft(list)
+        total = 0
+        for word in words:
+            groups[_normalize(word[:1], case_sensitive, decode_ascii)[:1]].append(word)
+            total += 1
+        n_shards = 4 * n_workers
+        shards, running = [[]], 0
+        for char in sorted(groups):
+            if shards[-1] and running >= len(shards) * total / n_shards:
+                shards.append([])
+            group = groups.pop(char)
+            shards[-1].extend(group)
+            running += len(group)
+
+        trie = cls(
+            case_sensitive=case_sensitive,
+            decode_ascii=decode_ascii,
+            storage=options["storage"],
+            tokenizer=options["tokenizer"],
+            term_ids=options["term_ids"],
+            keep_surfaces=options["keep_surfaces"]
+        )
+        tasks = [dict(options, words=shard) for shard in shards]
+        with get_context().Pool(min(n_workers, len(tasks))) as pool:
+            for part in pool.imap(_build_shard, tasks):
+                disjoint = not (
+                    set(char for char, _ in trie._nodes.children(trie._nodes.root))
+                    & set(char for char, _ in part._nodes.children(part._nodes.root))
+                )
+                if isinstance(trie._nodes, _ArrayNodes) and disjoint:
+                    trie._nodes.absorb(part._nodes, trie._n_ids)
+                    trie._n_terms += part._n_terms
+                    trie._n_ids += part._n_ids
+                    trie._terms = None
+                    trie._surfaces.update(part._surfaces)
+                else:
+                    trie.__merge(part, share=True)
+        if minimize:
+            trie.minimize()
+        return trie
+
+    def merge(self, other: Any) -> Any:
         """
+        Adds all the terms of another trie to this one, with their values,
+        scores and surface forms. Values and scores of `other` replace
+        those of terms in both tries, except in counting mode, where counts
+        are added up (and the least frequent terms are then evicted if the
+        trie exceeds its capacity). Both tries are walked together and
+        subtrees missing from this trie are copied over whole, without
+        normalizing nor looking up their terms again. `other` is left
+        unchanged. Same as `trie |= other`. With term ids (see the
+        constructor), terms new to this trie are given new ids.
+
         Parameters
         ----------
-        word: str
-            A string of arbitrary length to look up on the trie.
+        other: snippyts.Trie
+            A trie with the same `case_sensitive` and `decode_ascii`
+            settings, and any storage.
 
         Returns
         -------
-        bool
-            True if the trie contains the value denoted by the input
-            argument, and False otherwise.
+        snippyts.Trie
+            The same object the method has been called on.
 
-            A full match is required (over all the characters in the input
-            string), otherwise no matches are returned and none are assumed
-            to exist.
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ["orca", "oro"]
+        >>> other = Trie(storage="array")
+        >>> other += ["orco", "oro", "oráculo"]
+        >>> trie |= other
+        >>> len(trie), trie.search("or")
+        (4, ['orca', 'orco', 'oro', 'oraculo'])
 
-            To get matches for partial strings, use method `search` instead.
         """
-        candidates = self.search(word)
-        return [candidate for candidate in candidates if candidate == word]
+        self.__merge(other, share=False)
+        return self
+
+    def __ior__(self, other: Any) -> Any:
+        return self.merge(other)
 
-    def __lookup(
+    def __merge(self, other: Any, share: bool) -> None:
+        # With `share`, subtrees of `other` can be linked instead of copied,
+        # which is only safe if `other` is discarded afterwards.
+        if self._readonly:
+            raise ReadOnlyTrieError("cannot add terms to a read-only Trie")
+        if (self.case_sensitive, self.decode_ascii) != (
+            other.case_sensitive, other.decode_ascii
+        ):
+            raise IncompatibleTrieError(
+                "cannot merge tries with different normalization settings"
+            )
+        nodes, theirs = self._nodes, other._nodes
+        # Linked subtrees would keep the term ids given by `other`.
+        share = share and not other._readonly and not (
+            self.term_ids or other.term_ids
+        )
+        # Only terms new to this trie take the surface form of `other`.
+        surfaces = dict([])
+        if self.keep_surfaces:
+            for word, surface in other._surfaces.items():
+                node = nodes.walk(word)
+                if node is None or not nodes.is_terminal(node):
+                    surfaces[word] = surface
+        scored = []
+        path = []
+        stack = [(nodes.root, theirs.root, 0, "")]
+        while stack:
+            mine, node, depth, word = stack.pop()
+            del path[depth:]
+            path.append(mine)
+            if theirs.is_terminal(node):
+                if not nodes.is_terminal(mine):
+                    nodes.set_terminal(mine)
+                    if self.term_ids:
+                        self.__assign_id(mine, word)
+                    for ancestor in path:
+                        nodes.resize(ancestor, 1)
+                    self._n_terms += 1
+                value = theirs.value(node, _MISSING)
+                if value is not _MISSING:
+                    nodes.set_value(mine, value)
+                score = theirs.score(node)
+                if score is not None:
+                    if self.counting:
+                        score += nodes.score(mine) or 0
+                    scored.append((word, score))
+            for char, child in theirs.children(node):
+                target = nodes.child(mine, char)
+                if target is not None:
+                    stack.append((target, child, depth + 1, word + char))
+                    continue
+                self.__graft(mine, char, theirs, child, share)
+                size, best = theirs.size(child), theirs.best(child)
+                for ancestor in path:
+                    nodes.resize(ancestor, size)
+                    if nodes.best(ancestor) < best:
+                        nodes.set_best(ancestor, best)
+                self._n_terms += size
+        for word, score in scored:
+            self.__rescore(word, score)
+        self._surfaces.update(surfaces)
+        self._automaton = None
+        self._substrings = None
+        if self.counting and self.capacity is not None:
+            self._heap = []
+            while self._n_terms > self.capacity:
+                self.__evict()
+
+    def __graft(
         self,
-        word: str,
-        tree: Dict[str, Union[str, Dict]],
-        history: List[str],
-        remainder: List[str],
-        results: List[str],
-    ) -> List[str]:
-        part = remainder.pop(0)
-        if part not in tree:
-            return results
-        else:
-            tree = tree[part]
-            if remainder:
-                return self.__lookup(
-                    word, tree, history + [part], remainder, results
-                )
-            else:
-                return results + self.__pull_all_children(history + [part], tree)
+        node: Any,
+        char: str,
+        other: Any,
+        child: Any,
+        share: bool
+    ) -> None:
+        # Adds the subtree of node storage `other` rooted at `child` as the
+        # child of `node` reached with `char`.
+        nodes = self._nodes
+        if share and isinstance(nodes, _DictNodes) and isinstance(other, _DictNodes):
+            nodes.redirect(node, char, child)
+            return
+        queue = deque([(nodes.add_child(node, char), child)])
+        while queue:
+            new, old = queue.popleft()
+            if other.is_terminal(old):
+                nodes.set_terminal(new)
+                if self.term_ids:
+                    self.__assign_id(new)
+            nodes.resize(new, other.size(old))
+            value = other.value(old, _MISSING)
+            if value is not _MISSING:
+                nodes.set_value(new, value)
+            if other.score(old) is not None:
+                nodes.set_score(new, other.score(old))
+            if other.best(old) > nodes.best(new):
+                nodes.set_best(new, other.best(old))
+            for label, grandchild in other.children(old):
+                queue.append((nodes.add_child(new, label), grandchild))
 
-    def __pull_all_children(
+    def __batches(
         self,
-        history: List[str],
-        tree: List[str]
-    ) -> List[str]:
-        _children = []
-        for key, val in tree.items():
-            if key == "#":
-                _children.append("".join(history))
-                continue
-            _child = [ch for ch in history] + [key]
-            if val.keys():
-                _children += self.__pull_all_children(_child, val)
-            else:
-                _children.append(_child)
-        return _children
+        words: Iterable[str],
+        batch_size: int
+    ) -> Iterator[List[Tuple[str, str]]]:
+        # Yields batches of (normalized word, original word) pairs.
+        batch = []
+        for word in words:
+            batch.append(word)
+            if len(batch) == batch_size:
+                yield list(zip(self.__preprocess_words(batch), batch))
+                batch = []
+        if batch:
+            yield list(zip(self.__preprocess_words(batch), batch))
+
+    def minimize(self) -> Any:
+        """
+        Minimizes the trie into a directed acyclic word graph (DAWG): all
+        subtrees accepting the same set of suffixes are merged into one, so
+        that common endings (e.g. inflectional suffixes) are stored once.
+        Look-up works exactly as before, but the trie becomes read-only and
+        `add` raises `ReadOnlyTrieError` afterwards, also once saved and
+        opened again or copied. Terms with an id (see the constructor) are
+        all distinct, so they cannot be merged.
+
+        Returns
+        -------
+        snippyts.Trie
+            The same object the method has been called on.
+
+        Examples
+        --------
+        >>> trie = Trie.from_iterable(["cantar", "cantaba", "saltar", "saltaba"])
+        >>> before = trie._nodes.n_nodes()
+        >>> trie = trie.minimize()
+        >>> trie._nodes.n_nodes() < before
+        True
+        >>> trie.search("salt")
+        ['saltaba', 'saltar']
+        >>> trie.count("canta")
+        2
+
+        """
+        nodes = self._nodes
+        order = [nodes.root]
+        seen = set([nodes.key(nodes.root)])
+        for node in order:
+            for _, child in nodes.children(node):
+                if nodes.key(child) not in seen:
+                    seen.add(nodes.key(child))
+                    order.append(child)
+        register = dict([])
+        canonical = dict([])
+        for node in reversed(order):
+            signature = []
+            for char, child in nodes.children(node):
+                merged = canonical[nodes.key(child)]
+                if merged is not child:
+                    nodes.redirect(node, char, merged)
+                signature.append((char, nodes.key(merged)))
+            # Terms carrying a value are never merged, as values need not be
+            # hashable nor equal for equivalent subtrees.
+            marker = nodes.is_terminal(node)
+            if nodes.value(node, _MISSING) is not _MISSING:
+                marker = ("value", nodes.key(node))
+            signature = (
+                marker, nodes.score(node), nodes.term_id(node),
+                *sorted(signature)
+            )
+            canonical[nodes.key(node)] = register.setdefault(signature, node)
+        if isinstance(nodes, _ArrayNodes):
+            self._nodes = _ArrayNodes.from_nodes(nodes)
+        self._readonly = True
+        self._minimized = True
+        self._automaton = None
+        return self
+
+    def add(
+        self,
+        word: str,
+        value: Any = None,
+        score: Optional[float] = None
+    ) -> None:
+        """
+        Parameters
+        ----------
+        word: str
+            New term to be added to the trie. Adding an existing term again
+            updates its value and score if given.
+
+        value: Any
+            Optional payload stored with the term, returned by method `get`.
+
+        score: Optional[float]
+            Optional weight of the term (e.g. its frequency) used to rank
+            completions in method `top_k`. In counting mode, the amount the
+            count of the term is incremented by (1 if not given).
+
+        Returns
+        -------
+        Nothing.
+
+        """
+        if self._readonly:
+            raise ReadOnlyTrieError("cannot add terms to a read-only Trie")
+        surface = word
+        word = self.__preprocess_word(word)
+        if not word:
+            return
+        if self.counting:
+            score = self.__increment(word, 1 if score is None else score)
+        node = self.__insert(word, surface)
+        if value is not None:
+            self._nodes.set_value(node, value)
+        if score is not None:
+            self.__rescore(word, score)
+
+    def __increment(self, word: str, increment: float) -> float:
+        # Returns the new count of `word`, evicting the term with the lowest
+        # count first if `word` is new and the trie is full.
+        nodes = self._nodes
+        node = nodes.walk(word)
+        if node is not None and nodes.is_terminal(node):
+            count = (nodes.score(node) or 0) + increment
+        elif self.capacity is not None and self._n_terms >= self.capacity:
+            count = self.__evict() + increment
+        else:
+            count = increment
+        if self.capacity is not None:
+            if len(self._heap) >= 2 * self.capacity:
+                self.__reheap()
+            heapq.heappush(self._heap, (count, word))
+        return count
+
+    def __evict(self) -> float:
+        nodes = self._nodes
+        while True:
+            if not self._heap:
+                self.__reheap()
+            count, word = heapq.heappop(self._heap)
+            node = nodes.walk(word)
+            if (
+                node is not None
+                and nodes.is_terminal(node)
+                and nodes.score(node) == count
+            ):
+                self.remove(word)
+                return count
+
+    def __reheap(self) -> None:
+        # Drops stale pairs, keeping one pair per term.
+        nodes = self._nodes
+        self._heap = [
+            (nodes.score(nodes.walk(word)) or 0, word)
+            for word in self.complete()
+        ]
+        heapq.heapify(self._heap)
+
+    def __insert(self, word: str, surface: Optional[str] = None) -> Any:
+        # The surface form is only recorded when kept, when the term is new
+        # and only if it differs from the normalized term.
+        nodes = self._nodes
+        node = nodes.walk(word)
+        if node is not None and nodes.is_terminal(node):
+            return node
+        node = nodes.root
+        nodes.resize(node, 1)
+        for char in word:
+            child = nodes.child(node, char)
+            if child is None:
+                child = nodes.add_child(node, char)
+            node = child
+            nodes.resize(node, 1)
+        nodes.set_terminal(node)
+        if self.keep_surfaces and surface is not None and surface != word:
+            self._surfaces[word] = surface
+        if self.term_ids:
+            self.__assign_id(node, word)
+        self._n_terms += 1
+        self._automaton = None
+        self._substrings = None
+        return node
+
+    def __assign_id(self, node: Any, word: Optional[str] = None) -> None:
+        # The list of terms by id is dropped if the term is not known.
+        self._nodes.set_term_id(node, self._n_ids)
+        self._n_ids += 1
+        if self._terms is not None and word is not None:
+            self._terms.append(word)
+        else:
+            self._terms = None
+
+    def __rescore(self, word: str, score: Optional[float]) -> None:
+        # Sets the score of `word` and updates the best score of every node
+        # on its path: raising a score only needs a running maximum, while
+        # lowering or removing it requires recomputing the path bottom-up.
+        nodes = self._nodes
+        path = [nodes.root]
+        for char in word:
+            path.append(nodes.child(path[-1], char))
+        previous = nodes.score(path[-1])
+        nodes.set_score(path[-1], score)
+        if score is not None and (previous is None or score >= previous):
+            for node in path:
+                if nodes.best(node) < score:
+                    nodes.set_best(node, score)
+            return
+        for node in reversed(path):
+            best = max(
+                [nodes.best(child) for _, child in nodes.children(node)],
+                default=-inf
+            )
+            own = nodes.score(node)
+            nodes.set_best(node, best if own is None else max(best, own))
+
+    def remove(self, word: str) -> bool:
+        """
+        Removes a term from the trie, together with its value, score and
+        surface form. Nodes left without any term below them are pruned, so
+        that removing a term undoes adding it. With "array" storage, pruned
+        nodes are only unlinked and the arrays are compacted once they hold
+        more pruned nodes than live ones.
+
+        Parameters
+        ----------
+        word: str
+            Term to be removed. It is normalized the same way as the terms
+            added to the trie.
+
+        Returns
+        -------
+        bool
+            True if the term was in the trie, False otherwise.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ["orca", "orco", "oro"]
+        >>> trie.remove("Orco"), trie.remove("or")
+        (True, False)
+        >>> len(trie), trie.search("or")
+        (2, ['orca', 'oro'])
+        >>> trie -= ["orca", "oro"]
+        >>> len(trie), trie.stats()["n_nodes"]
+        (0, 1)
+
+        """
+        if self._readonly:
+            raise ReadOnlyTrieError("cannot remove terms from a read-only Trie")
+        word = self.__preprocess_word(word)
+        nodes = self._nodes
+        node = nodes.walk(word)
+        if not word or node is None or not nodes.is_terminal(node):
+            return False
+        if nodes.score(node) is not None:
+            self.__rescore(word, None)
+        if self._terms is not None and nodes.term_id(node) >= 0:
+            self._terms[nodes.term_id(node)] = None
+        nodes.unset_terminal(node)
+        self._surfaces.pop(word, None)
+        path = [nodes.root]
+        for char in word:
+            path.append(nodes.child(path[-1], char))
+        for node in path:
+            nodes.resize(node, -1)
+        # Only the topmost empty node needs to be detached.
+        for depth, node in enumerate(path[1:]):
+            if not nodes.size(node):
+                nodes.remove_child(path[depth], word[depth])
+                break
+        self._n_terms -= 1
+        self._automaton = None
+        self._substrings = None
+        if isinstance(nodes, _ArrayNodes) and nodes.n_dead > nodes.n_nodes():
+            self._nodes = _ArrayNodes.from_nodes(nodes)
+        return True
+
+    def get(self, word: str, default: Any = None) -> Any:
+        """
+        Parameters
+        ----------
+        word: str
+            A term to look up. It is normalized the same way as the terms
+            added to the trie.
+
+        default: Any
+            Value returned if the term is not in the trie or has no value.
+
+        Returns
+        -------
+        Any
+            The value stored with the term (see method `add`).
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie.add("oración", value={"pos": "NOUN"})
+        >>> trie.get("Oración")
+        {'pos': 'NOUN'}
+        >>> trie.get("orca", "n/a")
+        'n/a'
+
+        """
+        nodes = self._nodes
+        node = nodes.walk(self.__preprocess_query(word))
+        if node is None or not nodes.is_terminal(node):
+            return default
+        return nodes.value(node, default)
+
+    def term_id(self, word: str) -> Optional[int]:
+        """
+        Parameters
+        ----------
+        word: str
+            A term to look up. It is normalized the same way as the terms
+            added to the trie.
+
+        Returns
+        -------
+        Optional[int]
+            The id of the term (see argument `term_ids` of the
+            constructor), or None if it is not in the trie.
+
+        Examples
+        --------
+        >>> trie = Trie(term_ids=True)
+        >>> trie += ["orca", "oración"]
+        >>> trie.term_id("Oración"), trie.term_id("oro")
+        (1, None)
+
+        """
+        self.__check_term_ids()
+        nodes = self._nodes
+        node = nodes.walk(self.__preprocess_query(word))
+        if node is None or not nodes.is_terminal(node):
+            return None
+        return nodes.term_id(node)
+
+    def id_to_term(self, idx: int) -> str:
+        """
+        Parameters
+        ----------
+        idx: int
+            A term id, as returned by methods `term_id`, `search` and
+            `scan`.
+
+        Returns
+        -------
+        str
+            The term with that id, as stored in the trie. Raises `KeyError`
+            if no term has the id, e.g. because it was removed.
+
+        Examples
+        --------
+        >>> trie = Trie(term_ids=True)
+        >>> trie += ["orca", "oración"]
+        >>> trie.id_to_term(1)
+        'oracion'
+
+        """
+        self.__check_term_ids()
+        terms = self._terms
+        if terms is None:
+            # Built aside so that concurrent readers never see it half done.
+            nodes = self._nodes
+            terms = [None] * self._n_ids
+            for term in self.complete():
+                terms[nodes.term_id(nodes.walk(term))] = term
+            self._terms = terms
+        term = terms[idx] if 0 <= idx < len(terms) else None
+        if term is None:
+            raise KeyError(idx)
+        return term
+
+    def __check_term_ids(self) -> None:
+        if not self.term_ids:
+            raise TermIdsDisabledError(
+                "term ids require a Trie created with term_ids=True"
+            )
+
+    def frequency(self, word: str) -> float:
+        """
+        Parameters
+        ----------
+        word: str
+            A term to look up. It is normalized the same way as the terms
+            added to the trie.
+
+        Returns
+        -------
+        float
+            The count of the term in a counting trie, or its score otherwise
+            (see method `add`). 0 if the term is not in the trie or has no
+            score.
+
+        """
+        nodes = self._nodes
+        node = nodes.walk(self.__preprocess_query(word))
+        if node is None or not nodes.is_terminal(node):
+            return 0
+        return nodes.score(node) or 0
+
+    def total(self, prefix: str = "") -> float:
+        """
+        Parameters
+        ----------
+        prefix: str
+            A prefix to add up the counts of the completions of.
+
+        Returns
+        -------
+        float
+            Sum of the counts (or scores) of all the terms starting with
+            `prefix`.
+
+        Examples
+        --------
+        >>> trie = Trie(counting=True)
+        >>> trie += "el oro y la orca y el oro".split()
+        >>> trie.frequency("oro"), trie.total("or"), trie.total()
+        (2, 3, 8)
+
+        """
+        nodes = self._nodes
+        node = nodes.walk(self.__preprocess_query(prefix))
+        total = 0
+        stack = [] if node is None else [node]
+        while stack:
+            node = stack.pop()
+            if nodes.is_terminal(node):
+                total += nodes.score(node) or 0
+            stack.extend(child for _, child in nodes.children(node))
+        return total
+
+    def most_common(
+        self,
+        n: Optional[int] = None,
+        prefix: str = ""
+    ) -> List[Tuple[str, float]]:
+        """
+        Same as `collections.Counter.most_common`, scoped to the terms
+        starting with `prefix` (see method `top_k`).
+
+        Parameters
+        ----------
+        n: Optional[int]
+            Number of terms to return. All terms by default.
+
+        prefix: str
+            Prefix all returned terms must start with.
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            A list of (term, count) tuples sorted by decreasing count and
+            then alphabetically.
+
+        Examples
+        --------
+        >>> trie = Trie(counting=True)
+        >>> trie += "el oro y la orca y el oro y el oro".split()
+        >>> trie.most_common(4)
+        [('el', 3), ('oro', 3), ('y', 3), ('la', 1)]
+        >>> trie.most_common(prefix="or")
+        [('oro', 3), ('orca', 1)]
+
+        With a capacity, infrequent terms are evicted and counts are upper
+        bounds:
+
+        >>> trie = Trie(counting=True, capacity=3)
+        >>> trie += "el oro y la orca y el oro y el oro".split()
+        >>> trie.most_common()
+        [('el', 4), ('oro', 4), ('y', 3)]
+
+        """
+        k = self._n_terms if n is None else n
+        return [(term, count) for count, term in self.top_k(prefix, k)]
+
+    def top_k(self, prefix: str = "", k: int = 10) -> List[Tuple[float, str]]:
+        """
+        Returns the `k` completions of `prefix` with the highest scores (see
+        method `add`). Every node keeps the best score found below it, so
+        the search is best-first and only expands the branches that can
+        still hold one of the `k` best terms: its cost depends on `k` and
+        not on the number of completions. Terms without a score are not
+        ranked.
+
+        Parameters
+        ----------
+        prefix: str
+            Prefix all returned terms must start with.
+
+        k: int
+            Maximum number of terms to return.
+
+        Returns
+        -------
+        List[Tuple[float, str]]
+            A list of (score, term) tuples sorted by decreasing score and
+            then alphabetically.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> for term, frequency in [
+        ...    ("orca", 12), ("orco", 3), ("oro", 40),
+        ...    ("orwelliano", 1), ("oráculo", 7), ("oración", 25),
+        ... ]:
+        ...    trie.add(term, score=frequency)
+        >>> trie.top_k("or", k=3)
+        [(40, 'oro'), (25, 'oracion'), (12, 'orca')]
+        >>> trie.top_k("orc")
+        [(12, 'orca'), (3, 'orco')]
+        >>> trie.add("oro", score=2)
+        >>> trie.top_k("or", k=2)
+        [(25, 'oracion'), (12, 'orca')]
+
+        """
+        nodes = self._nodes
+        prefix = self.__preprocess_query(prefix)
+        node = nodes.walk(prefix)
+        if node is None or k <= 0 or nodes.best(node) == -inf:
+            return []
+        # Entries are (-priority, path, kind, node) with kind 0 for a term
+        # and 1 for a subtree, so terms come before their extensions.
+        heap = [(-nodes.best(node), prefix, 1, node)]
+        ranked = []
+        while heap and len(ranked) < k:
+            priority, path, kind, node = heapq.heappop(heap)
+            if not kind:
+                ranked.append((-priority, path))
+                continue
+            score = nodes.score(node)
+            if score is not None and nodes.is_terminal(node):
+                heapq.heappush(heap, (-score, path, 0, node))
+            for char, child in nodes.children(node):
+                best = nodes.best(child)
+                if best > -inf:
+                    heapq.heappush(heap, (-best, path + char, 1, child))
+        return ranked
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Writes the trie to disk in a flat binary layout: a short JSON header
+        followed by the columns of the "array" storage engine (see
+        `SUPPORTED_STORAGES`) and the pickled values and surface forms of the
+        terms, if any. Tries with "dict" storage are converted on the fly. The file can be loaded back with `Trie.open`.
+
+        The trie is written to a temporary file in the same folder, which
+        is then renamed over `path`, so that a trie memory-mapped from
+        `path` (including this one) keeps reading the previous file.
+
+        Parameters
+        ----------
+        path: Union[str, Path]
+            Location of the output file, as a POSIX path.
+
+        Returns
+        -------
+        Nothing.
+
+        """
+        nodes = self._nodes
+        if not isinstance(nodes, _ArrayNodes) or nodes.n_dead:
+            nodes = _ArrayNodes.from_nodes(nodes)
+        header = {
+            "case_sensitive": self.case_sensitive,
+            "decode_ascii": self.decode_ascii,
+            "n_terms": self._n_terms,
+            "counting": self.counting,
+            "capacity": self.capacity,
+            "term_ids": self.term_ids,
+            "n_ids": self._n_ids,
+            "keep_surfaces": self.keep_surfaces,
+            "minimized": self._minimized,
+            "byteorder": sys.byteorder,
+            "columns": dict([]),
+        }
+        columns = [(name, getattr(nodes, name)) for name in nodes.columns()]
+        offset = 0
+        for name, column in columns:
+            column = memoryview(column)
+            header["columns"][name] = [offset, column.format, len(column)]
+            offset += column.nbytes + -column.nbytes % 8
+        values = pdumps(nodes.values)
+        header["values"] = [offset, len(values)]
+        surfaces = pdumps(self._surfaces)
+        header["surfaces"] = [offset + len(values), len(surfaces)]
+        encoded = json.dumps(header).encode()
+        encoded += b" " * (-(len(MAGIC) + 8 + len(encoded)) % 8)
+        path = Path(path).expanduser().resolve()
+        handle, temporary = tempfile.mkstemp(
+            dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(handle, "wb") as wrt:
+                wrt.write(MAGIC)
+                wrt.write(struct.pack("<Q", len(encoded)))
+                wrt.write(encoded)
+                for name, column in columns:
+                    column = memoryview(column).cast("B")
+                    wrt.write(column)
+                    wrt.write(b"\0" * (-len(column) % 8))
+                wrt.write(values)
+                wrt.write(surfaces)
+            # `mkstemp` creates the file readable by its owner only.
+            os.chmod(temporary, _file_mode(path))
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    @classmethod
+    def open(
+        cls,
+        path: Union[str, Path],
+        mmap: bool = True,
+        tokenizer: Tokenizer = wordpunct_tokenize
+    ) -> Any:
+        """
+        Loads a trie written by method `save`.
+
+        Parameters
+        ----------
+        path: Union[str, Path]
+            Location of the file, as a POSIX path.
+
+        mmap: bool
+            If true (default), the file is memory-mapped and searched in
+            place: opening is near-instant regardless of the size of the
+            trie and all processes opening the same file share its pages
+            in the operating system's page cache. The resulting trie is
+            read-only and `add` raises `ReadOnlyTrieError`. If false, the
+            file is read into memory and the trie can be extended, unless it
+            was minimized (see method `minimize`).
+
+        tokenizer: Tokenizer
+            Tokenizer of the loaded trie (see the constructor), as it is not
+            part of the file.
+
+        Returns
+        -------
+        snippyts.Trie
+            A trie with "array" storage.
+
+        Examples
+        --------
+        >>> import os
+        >>> path_trie = "trie_dump.bin"
+        >>> trie = Trie()
+        >>> trie += ["orca", "orco", "oro", "orwelliano", "oráculo", "oración"]
+        >>> trie.save(path_trie)
+        >>> mapped = Trie.open(path_trie)
+        >>> assert mapped.search("ora") == ['oraculo', 'oracion']
+        >>> assert "orco" in mapped
+        >>> try:
+        ...   mapped.add("orcas")
+        ... except ReadOnlyTrieError:
+        ...   assert True
+        >>> loaded = Trie.open(path_trie, mmap=False)
+        >>> loaded.add("orcas")
+        >>> assert loaded.count("orc") == 3
+        >>> mapped.save(path_trie)
+        >>> assert Trie.open(path_trie).search("ora") == mapped.search("ora")
+        >>> del mapped
+        >>> os.remove(path_trie)
+
+        """
+        path = Path(path).expanduser().resolve()
+        header, columns = _read_header(path)
+        trie = cls(
+            case_sensitive=header["case_sensitive"],
+            decode_ascii=header["decode_ascii"],
+            storage="array",
+            tokenizer=tokenizer,
+            counting=header["counting"],
+            capacity=header["capacity"],
+            term_ids=header["term_ids"],
+            keep_surfaces=header["keep_surfaces"],
+        )
+        trie._nodes = _ArrayNodes.from_file(
+            path, columns, header["values"], mmap
+        )
+        offset, length = header["surfaces"]
+        with open(path, "rb") as rd:
+            rd.seek(offset)
+            trie._surfaces = ploads(rd.read(length))
+        trie._n_terms = header["n_terms"]
+        trie._n_ids = header["n_ids"]
+        trie._terms = None
+        trie._minimized = header["minimized"]
+        trie._readonly = mmap or trie._minimized
+        return trie
+
+    def copy(self) -> Any:
+        """
+        Returns
+        -------
+        snippyts.Trie
+            An independent copy of the trie: adding terms to or removing
+            terms from either trie leaves the other unchanged. Values of
+            terms are not copied but shared. Copies of memory-mapped tries
+            are held in memory and can be extended, unless minimized.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ["orca", "orco"]
+        >>> other = trie.copy()
+        >>> other.add("oro")
+        >>> len(trie), len(other)
+        (2, 3)
+
+        """
+        trie = shallow_copy(self)
+        trie._nodes = self._nodes.copy()
+        trie._heap = list(self._heap)
+        trie._terms = None if self._terms is None else list(self._terms)
+        trie._surfaces = dict(self._surfaces)
+        trie._readonly = self._minimized or (
+            self._readonly and getattr(self._nodes, "source", None) is None
+        )
+        return trie
+
+    def nbytes(self) -> int:
+        """
+        Returns
+        -------
+        int
+            Approximate number of bytes taken up by the nodes of the trie
+            (the containers holding them, not the `Trie` object itself) and
+            by its surface forms, if kept.
+
+        """
+        return self._nodes.nbytes() + sys.getsizeof(self._surfaces) + sum(
+            sys.getsizeof(term) + sys.getsizeof(surface)
+            for term, surface in self._surfaces.items()
+        )
+
+    def bytes_per_term(self) -> float:
+        """
+        Returns
+        -------
+        float
+            Approximate number of bytes of node storage per term added to
+            the trie. Useful to compare storage engines on a vocabulary.
+
+        Examples
+        --------
+        >>> stems = ["orca", "orco", "oro", "orwelliano", "oraculo", "oracion"]
+        >>> words = [f"{stem}{idx}" for stem in stems for idx in range(100)]
+        >>> by_dict = Trie(storage="dict")
+        >>> by_dict += words
+        >>> by_array = Trie(storage="array")
+        >>> by_array += words
+        >>> assert by_array.bytes_per_term() < by_dict.bytes_per_term() / 5
+
+        """
+        return self.nbytes() / max(self._n_terms, 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns
+        -------
+        Dict[str, Any]
+            Memory statistics of the trie: its storage engine (`storage`),
+            number of terms (`n_terms`) and of live nodes (`n_nodes`), and
+            the approximate bytes taken up by the nodes (`nbytes`, see
+            method `nbytes`) overall and per term (`bytes_per_term`).
+
+        Examples
+        --------
+        >>> trie = Trie(storage="array")
+        >>> trie += ["orca", "orco", "oro"]
+        >>> stats = trie.stats()
+        >>> stats["n_terms"], stats["n_nodes"]
+        (3, 7)
+
+        """
+        return {
+            "storage": self.storage,
+            "n_terms": self._n_terms,
+            "n_nodes": self._nodes.n_nodes(),
+            "nbytes": self.nbytes(),
+            "bytes_per_term": self.bytes_per_term(),
+        }
+
+    def __contains__(self, word: str) -> bool:
+        """
+        Parameters
+        ----------
+        word: str
+            A string of arbitrary length to look up on the trie.
+
+        Returns
+        -------
+        bool
+            True if the trie contains the value denoted by the input
+            argument, and False otherwise.
+
+            A full match is required (over all the characters in the input
+            string), otherwise no matches are returned and none are assumed
+            to exist.
+
+            Like the class's call, it walks at most `len(word)` nodes.
+
+            To get matches for partial strings, use method `search` instead.
+        """
+        return self.__exact(word)
+
+    def contains_many(self, words: Iterable[str]) -> List[bool]:
+        """
+        Batched version of `contains` (`word in trie`).
+
+        Parameters
+        ----------
+        words: Iterable[str]
+            Strings to look up on the trie.
+
+        Returns
+        -------
+        List[bool]
+            One boolean per input string, True if the trie contains it.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ['mes', 'mirena', 'ok']
+        >>> trie.contains_many(['ok', 'Ok', 'mire', 'mirena'])
+        [True, False, False, True]
+
+        """
+        exact = self.__exact
+        return [exact(word) for word in words]
+
+    def __exact(self, word: str) -> bool:
+        # Terms are matched as stored, i.e. `word` must already be in its
+        # normalized form.
+        if not isinstance(word, str) or self.__preprocess_query(word) != word:
+            return False
+        node = self._nodes.walk(word)
+        return node is not None and self._nodes.is_terminal(node)
+
+    def search(
+        self,
+        text: Union[str, Sequence[str]],
+        spans: bool = False,
+        ids: bool = False
+    ) -> Union[List[str], List[Match], array]:
+        """
+        Parameters
+        ----------
+        word: Union[str, Sequence[str]]
+            A string of arbitrary length to look up on the trie.
+
+            The value can denote both a partial string or a full string.
+            Regardless, method `search` will return all matches of that
+            string, including longer terms the matching string is a substring
+            of. To force full matches, call the class itself, or invoke its
+            `contains` method.
+
+            Strings are split into tokens with the tokenizer of the trie. A
+            sequence of strings is taken to be already tokenized and its
+            items are looked up as they are.
+
+        spans: bool
+            If true, every match is returned as a `Match` carrying the
+            offsets of the matching token in `text` and the surface form
+            the term was added with (see argument `keep_surfaces` of the
+            constructor), so that matches can be located in the
+            original text without scanning it again. For pre-tokenized
+            input, offsets are positions in the sequence of tokens.
+
+        ids: bool
+            If true, the ids of the matching terms (see argument `term_ids`
+            of the constructor) are returned instead of the terms, in the
+            same order, as an `array.array` of 64-bit integers. No string is
+            built, and the array can be wrapped by NumPy without copying it
+            (`numpy.frombuffer(ids, dtype=numpy.int64)`). Overrides `spans`.
+
+        Returns
+        -------
+        Union[List[str], List[Match], array]
+            A list with all the strings matching the input substring provided
+            as the value of argument `word`, a list of `Match` if `spans`
+            is true, or an array of term ids if `ids` is true.
+
+        Examples
+        --------
+        >>> trie = Trie(keep_surfaces=True)
+        >>> trie += ["oración", "oráculo", "orca"]
+        >>> trie.search("Una oración")
+        ['oracion']
+        >>> trie.search("Una oración", spans=True)
+        [Match(start=4, end=11, term='oracion', surface='oración')]
+        >>> trie.search(["una", "ora"])
+        ['oracion', 'oraculo']
+        >>> trie = Trie(term_ids=True)
+        >>> trie += ["oración", "oráculo", "orca"]
+        >>> trie.search("Una oración", ids=True)
+        array('q', [0])
+        >>> trie.search(["una", "ora", "orca"], ids=True)
+        array('q', [0, 1, 2])
+
+        """
+        if ids:
+            self.__check_term_ids()
+            # Matches of repeated tokens are copied from their first ones.
+            matches, seen = array("q"), dict([])
+            tokens = self.tokenizer(text) if isinstance(text, str) else text
+            for word in tokens:
+                span = seen.get(word)
+                if span is not None:
+                    matches.extend(matches[span[0]:span[1]])
+                    continue
+                start = len(matches)
+                node = self._nodes.walk(self.__preprocess_query(word))
+                if node is not None:
+                    self._nodes.subtree_ids(node, matches)
+                seen[word] = (start, len(matches))
+            return matches
+        matches = []
+        if not spans:
+            tokens = self.tokenizer(text) if isinstance(text, str) else text
+            for word in tokens:
+                word = self.__preprocess_query(word)
+                node = self._nodes.walk(word)
+                if node is not None:
+                    matches.extend(self.__pull_all_children(word, node))
+            return matches
+        for start, end, word in span_tokenize(text, self.tokenizer):
+            word = self.__preprocess_query(word)
+            node = self._nodes.walk(word)
+            if node is not None:
+                matches.extend(
+                    Match(start, end, term, self._surfaces.get(term, term))
+                    for term in self.__pull_all_children(word, node)
+                )
+        return matches
+
+    def search_counts(
+        self,
+        docs: Iterable[Union[str, Sequence[str]]]
+    ) -> array:
+        """
+        Counts the matches of method `search` per term over a collection of
+        documents, without building any string for the matching terms.
+
+        Parameters
+        ----------
+        docs: Iterable[Union[str, Sequence[str]]]
+            The documents to search, possibly a lazy generator. Documents
+            can also be sequences of tokens (see method `search`).
+
+        Returns
+        -------
+        array
+            An `array.array` of 64-bit integers with one count per term id
+            (see argument `term_ids` of the constructor): the count of a
+            term is at the position of its id, and ids of removed terms
+            count 0. Use method `id_to_term` to map positions back to
+            terms.
+
+        Examples
+        --------
+        >>> trie = Trie(term_ids=True)
+        >>> trie += ["oración", "oráculo", "orca"]
+        >>> counts = trie.search_counts(["Una oración", "Un orca", "ora"])
+        >>> counts
+        array('q', [2, 1, 1])
+        >>> trie.id_to_term(counts.index(max(counts)))
+        'oracion'
+
+        """
+        self.__check_term_ids()
+        counts = array("q", [0]) * self._n_ids
+        for doc in docs:
+            for idx in self.search(doc, ids=True):
+                counts[idx] += 1
+        return counts
+
+    def complete(
+        self,
+        prefix: str = "",
+        limit: Optional[int] = None,
+        offset: int = 0,
+        start: Optional[str] = None,
+        stop: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Lazily yields the terms in the trie starting with `prefix`, in
+        lexicographic order. Unlike `search`, nothing is materialized: the
+        cost of the call is proportional to the length of the prefix plus
+        the number of terms actually consumed, not to the size of the
+        subtree below the prefix.
+
+        Parameters
+        ----------
+        prefix: str
+            Prefix all returned terms must start with. It is normalized
+            the same way as the terms added to the trie. Defaults to the
+            empty string, i.e. all terms.
+
+        limit: Optional[int]
+            Maximum number of terms to yield. No limit by default.
+
+        offset: int
+            Number of matching terms to skip before yielding the first one.
+            Whole subtrees are skipped at once using their term counts.
+
+        start: Optional[str]
+            If given, only terms greater than or equal to `start` are
+            returned.
+
+        stop: Optional[str]
+            If given, only terms strictly lower than `stop` are returned.
+
+        Returns
+        -------
+        Iterator[str]
+            A generator over the matching terms.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += [
+        ...    "orca", "Orco", "orco", "oro",
+        ...    "orwelliano", "oráculo", "oración",
+        ... ]
+        >>> list(trie.complete("or"))
+        ['oracion', 'oraculo', 'orca', 'orco', 'oro', 'orwelliano']
+        >>> list(trie.complete("or", limit=2))
+        ['oracion', 'oraculo']
+        >>> list(trie.complete("or", limit=2, offset=2))
+        ['orca', 'orco']
+        >>> list(trie.complete(start="orc", stop="orw"))
+        ['orca', 'orco', 'oro']
+        >>> list(trie.complete("x"))
+        []
+
+        """
+        prefix = self.__preprocess_query(prefix)
+        if start is not None:
+            start = self.__preprocess_query(start)
+        if stop is not None:
+            stop = self.__preprocess_query(stop)
+        nodes = self._nodes
+        node = nodes.walk(prefix)
+        if node is None or limit == 0:
+            return
+        depth = len(prefix)
+        if start is not None and start[:depth] > prefix:
+            return
+        tight = start is not None and start[:depth] == prefix
+        emitted = 0
+        stack = [(prefix, node, tight)]
+        while stack:
+            path, node, tight = stack.pop()
+            if stop is not None and path >= stop:
+                return
+            if offset and not tight and nodes.size(node) <= offset:
+                offset -= nodes.size(node)
+                continue
+            if nodes.is_terminal(node) and (not tight or path == start):
+                if offset:
+                    offset -= 1
+                else:
+                    yield path
+                    emitted += 1
+                    if emitted == limit:
+                        return
+            bound = start[len(path)] if tight and len(path) < len(start) else None
+            for char, child in sorted(nodes.children(node), reverse=True):
+                if bound is None:
+                    stack.append((path + char, child, False))
+                elif char > bound:
+                    stack.append((path + char, child, False))
+                elif char == bound:
+                    stack.append((path + char, child, True))
+
+    def count(self, prefix: str = "") -> int:
+        """
+        Parameters
+        ----------
+        prefix: str
+            A prefix to count completions for.
+
+        Returns
+        -------
+        int
+            Number of terms in the trie starting with `prefix`. It is read
+            off the node the prefix leads to, so the cost of the call only
+            depends on the length of the prefix.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ["orca", "orco", "oro", "orwelliano", "oraculo", "oracion"]
+        >>> trie.count("or"), trie.count("orc"), trie.count("x")
+        (6, 2, 0)
+
+        """
+        node = self._nodes.walk(self.__preprocess_query(prefix))
+        return 0 if node is None else self._nodes.size(node)
+
+    def compile(self) -> Any:
+        """
+        Compiles the terms in the trie into an Aho-Corasick automaton used
+        by method `scan`. Calling it is optional: `scan` compiles the trie
+        on first use, and adding terms discards the compiled automaton.
+
+        Returns
+        -------
+        snippyts.Trie
+            The same object the method has been called on.
+
+        """
+        self._automaton = _Automaton(self._nodes)
+        return self
+
+    def index_substrings(self) -> Any:
+        """
+        Builds the suffix array over the terms of the trie used by method
+        `contains_substring`. Calling it is optional: `contains_substring`
+        builds the index on first use, and adding or removing terms
+        discards it. The index takes about 5 bytes per character of the
+        vocabulary and building it is linear in that size up to a log
+        factor.
+
+        Returns
+        -------
+        snippyts.Trie
+            The same object the method has been called on.
+
+        """
+        self._substrings = _SuffixArray(self.complete())
+        return self
+
+    def contains_substring(
+        self,
+        query: str,
+        limit: Optional[int] = None
+    ) -> List[str]:
+        """
+        Returns the terms containing `query` anywhere (infix search), unlike
+        `search`, which only returns terms starting with it. The matches
+        are located by binary search on a suffix array over the terms (see
+        method `index_substrings`), so the cost of a query depends on the
+        logarithm of the size of the vocabulary and on the number of
+        occurrences of `query` read, which `limit` bounds.
+
+        Parameters
+        ----------
+        query: str
+            The string to look for. It is normalized the same way as the
+            terms added to the trie.
+
+        limit: Optional[int]
+            Maximum number of terms to return. No limit by default.
+
+        Returns
+        -------
+        List[str]
+            The terms containing `query`, each once, ordered by the text
+            following the occurrence of `query` in them.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ["orca", "orco", "oro", "orwelliano", "oráculo", "oración"]
+        >>> trie.contains_substring("acul")
+        ['oraculo']
+        >>> sorted(trie.contains_substring("Ac"))
+        ['oracion', 'oraculo']
+        >>> trie.contains_substring("o", limit=2)
+        ['oraculo', 'orco']
+
+        """
+        if self._substrings is None:
+            self.index_substrings()
+        return self._substrings(self.__preprocess_query(query), limit)
+
+    def scan(
+        self,
+        text: str,
+        policy: str = "leftmost-longest",   # SUPPORTED_SCAN_POLICIES
+        boundaries: bool = True,
+        spans: bool = False,
+        ids: bool = False,
+    ) -> Union[List[str], List[Match], array]:
+        """
+        Finds every term of the trie occurring in `text` in a single linear
+        pass over the text, regardless of the size of the vocabulary. Unlike
+        `search`, the text is not tokenized, so terms spanning several
+        tokens (e.g. "new york") are found too, and only full terms are
+        returned (not completions of the tokens in the text).
+
+        Parameters
+        ----------
+        text: str
+            Document to scan. It is normalized character by character the
+            same way as the terms added to the trie.
+
+        policy: str
+            One of `SUPPORTED_SCAN_POLICIES`. With "leftmost-longest"
+            (default) overlapping matches are resolved by keeping, from left
+            to right, the match starting first and, among those, the longest
+            one. With "all" every occurrence of every term is returned,
+            including overlapping and nested ones.
+
+        boundaries: bool
+            If true (default), matches must start and end at word boundaries,
+            i.e. they cannot be preceded or followed by an alphanumeric
+            character. If false, terms are matched anywhere in the text.
+
+        spans: bool
+            If true, every match is returned as a `Match` carrying its
+            offsets in `text` and the surface form the term was added with
+            (see argument `keep_surfaces` of the constructor).
+
+        ids: bool
+            If true, the ids of the matching terms are returned instead, as
+            in method `search`. Overrides `spans`.
+
+        Returns
+        -------
+        Union[List[str], List[Match], array]
+            The matching terms, in the order they occur in the text, a list
+            of `Match` if `spans` is true, or an array of term ids if `ids`
+            is true.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ["new", "new york", "york", "york city", "orca"]
+        >>> trie.scan("Orcas in New York City")
+        ['new york']
+        >>> trie.scan("Orcas in New York City", policy="all")
+        ['new', 'new york', 'york', 'york city']
+        >>> trie.scan("Orcas in New York City", boundaries=False)
+        ['orca', 'new york']
+        >>> trie.scan("Orcas in New York City", spans=True)
+        [Match(start=9, end=17, term='new york', surface='new york')]
+
+        """
+        if ids:
+            self.__check_term_ids()
+        matches = self.__scan(text, policy, boundaries)
+        nodes = self._nodes
+        if ids:
+            return array("q", [
+                nodes.term_id(nodes.walk(term)) for _, _, term in matches
+            ])
+        if not spans:
+            return [term for _, _, term in matches]
+        return [
+            Match(start, end, term, self._surfaces.get(term, term))
+            for start, end, term in matches
+        ]
+
+    def __scan(
+        self,
+        text: str,
+        policy: str,
+        boundaries: bool,
+    ) -> List[Tuple[int, int, str]]:
+        # Returns (start, end, term) triples where `start` and `end` are
+        # offsets into the original text.
+        if policy not in SUPPORTED_SCAN_POLICIES:
+            raise UnsupportedScanPolicyError(
+                f"got {policy} but expected {str(SUPPORTED_SCAN_POLICIES)}"
+            )
+        if self._automaton is None:
+            self.compile()
+        if text.isascii() and (self.case_sensitive or text.islower()):
+            stream, origin = text, None
+        elif text.isascii():
+            stream, origin = text.lower(), None
+        else:
+            chars, origin = [], []
+            for idx, char in enumerate(text):
+                char = self.__preprocess_query(char)
+                chars.append(char)
+                origin.extend([idx] * len(char))
+            stream = "".join(chars)
+
+        spans = self._automaton(stream)
+        if boundaries:
+            spans = (
+                (start, end) for start, end in spans
+                if (not start or not stream[start - 1].isalnum())
+                and (end == len(stream) or not stream[end].isalnum())
+            )
+        spans = sorted(spans, key=lambda span: (span[0], -span[1]))
+        if policy == "leftmost-longest":
+            selected, last = [], 0
+            for start, end in spans:
+                if start >= last:
+                    selected.append((start, end))
+                    last = end
+            spans = selected
+        else:
+            spans.sort()
+
+        return [
+            (start, end, stream[start:end]) if origin is None
+            else (origin[start], origin[end - 1] + 1, stream[start:end])
+            for start, end in spans
+        ]
+
+    def fuzzy(self, word: str, max_edits: int = 1) -> List[Tuple[int, str]]:
+        """
+        Finds the terms in the trie within `max_edits` insertions, deletions
+        or substitutions of `word` (Levenshtein distance). The trie is
+        walked depth-first alongside a Levenshtein automaton for `word`,
+        i.e. a deterministic automaton whose states are rows of the
+        edit-distance matrix capped at `max_edits + 1`. States and
+        transitions are built lazily and memoized, so each node visited
+        costs a single dictionary look-up, and branches are abandoned as
+        soon as the automaton reaches the state where every cell exceeds
+        `max_edits`.
+
+        Parameters
+        ----------
+        word: str
+            The string to look up. It is normalized the same way as the
+            terms added to the trie.
+
+        max_edits: int
+            Maximum edit distance between `word` and a returned term.
+
+        Returns
+        -------
+        List[Tuple[int, str]]
+            A list of (distance, term) tuples sorted by increasing distance
+            and then alphabetically.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ["orca", "orco", "oro", "orwelliano", "oráculo", "oración"]
+        >>> trie.fuzzy("orko")
+        [(1, 'orco'), (1, 'oro')]
+        >>> trie.fuzzy("oraciones", max_edits=2)
+        [(2, 'oracion')]
+        >>> trie.fuzzy("oraciones")
+        []
+
+        """
+        word = self.__preprocess_query(word)
+        nodes = self._nodes
+        cap = max_edits + 1
+        width = len(word) + 1
+        letters = set(word)
+        rows = [tuple(min(col, cap) for col in range(width)), (cap,) * width]
+        states = {row: state for state, row in enumerate(rows)}
+        delta = [dict([]), dict([])]
+        dead = 1
+
+        matches = []
+        stack = [(nodes.root, "", 0)]
+        while stack:
+            node, path, state = stack.pop()
+            for char, child in nodes.children(node):
+                # Characters absent from `word` all lead to the same state.
+                symbol = char if char in letters else None
+                target = delta[state].get(symbol)
+                if target is None:
+                    previous = rows[state]
+                    row = [min(previous[0] + 1, cap)]
+                    for col in range(1, width):
+                        row.append(min(
+                            row[col - 1] + 1,
+                            previous[col] + 1,
+                            previous[col - 1] + (word[col - 1] != char),
+                            cap
+                        ))
+                    row = tuple(row)
+                    target = states.setdefault(row, len(rows))
+                    if target == len(rows):
+                        rows.append(row)
+                        delta.append(dict([]))
+                    delta[state][symbol] = target
+                if target == dead:
+                    continue
+                distance = rows[target][-1]
+                if distance <= max_edits and nodes.is_terminal(child):
+                    matches.append((distance, path + char))
+                stack.append((child, path + char, target))
+        return sorted(matches)
+
+    def match(self, pattern: str) -> Iterator[str]:
+        """
+        Lazily yields the terms matching a shell-style pattern, in
+        lexicographic order. The trie is walked alongside an automaton for
+        the pattern whose states are built on demand and memoized, and only
+        the branches the pattern allows are visited: literal characters are
+        looked up directly instead of iterating over the children of a node,
+        so the cost depends on the number of matching paths rather than on
+        the size of the vocabulary.
+
+        Parameters
+        ----------
+        pattern: str
+            The pattern, with the syntax of module `fnmatch`: "*" matches
+            any sequence of characters, "?" any single character, "[seq]"
+            any character in `seq` (which can contain ranges such as "a-z")
+            and "[!seq]" any character not in `seq`. Any other character
+            matches itself. The pattern is normalized the same way as the
+            terms added to the trie.
+
+        Returns
+        -------
+        Iterator[str]
+            A generator over the matching terms.
+
+        Examples
+        --------
+        >>> trie = Trie()
+        >>> trie += ["orca", "orco", "oro", "orwelliano", "oráculo", "oración"]
+        >>> list(trie.match("o?co"))
+        ['orco']
+        >>> list(trie.match("orc?"))
+        ['orca', 'orco']
+        >>> list(trie.match("ora*"))
+        ['oracion', 'oraculo']
+        >>> list(trie.match("*o"))
+        ['oraculo', 'orco', 'oro', 'orwelliano']
+        >>> list(trie.match("or[!c]*o"))
+        ['oraculo', 'orwelliano']
+        >>> list(trie.match("Or[a-c][a-c]"))
+        ['orca']
+
+        """
+        tokens = _compile_pattern(self.__preprocess_query(pattern))
+        final = len(tokens)
+
+        def closure(positions):
+            # Stars can match the empty string, so they can be skipped.
+            closed = set(positions)
+            for position in sorted(closed):
+                while position < final and tokens[position] == ("*",):
+                    position += 1
+                    closed.add(position)
+            return frozenset(closed)
+
+        def literals(state):
+            # The characters leaving `state` if all of them are literals.
+            chars = set([])
+            for position in state:
+                if position == final:
+                    continue
+                if tokens[position][0] != "=":
+                    return None
+                chars.add(tokens[position][1])
+            return sorted(chars, reverse=True)
+
+        nodes = self._nodes
+        start = closure([0])
+        delta = dict([])
+        expansions = {start: literals(start)}
+        stack = [(nodes.root, "", start)]
+        while stack:
+            node, path, state = stack.pop()
+            if final in state and nodes.is_terminal(node):
+                yield path
+            chars = expansions[state]
+            if chars is None:
+                children = sorted(nodes.children(node), reverse=True)
+            else:
+                children = [(char, nodes.child(node, char)) for char in chars]
+            for char, child in children:
+                if child is None:
+                    continue
+                target = delta.get((state, char))
+                if target is None:
+                    target = closure(
+                        position + (tokens[position] != ("*",))
+                        for position in state
+                        if position < final and (
+                            tokens[position] == ("*",)
+                            or _accepts(tokens[position], char)
+                        )
+                    )
+                    delta[state, char] = target
+                    if target not in expansions:
+                        expansions[target] = literals(target)
+                if target:
+                    stack.append((child, path + char, target))
+
+    def search_many(
+        self,
+        docs: Iterable[str],
+        n_workers: Optional[int] = None,
+        chunksize: int = 1000,
+    ) -> Iterator[List[str]]:
+        """
+        Runs method `search` over a collection of documents on a pool of
+        worker processes.
+
+        The trie is shipped to the workers once, not with every task: with
+        the "fork" start method the workers inherit it from the parent
+        process, and otherwise every worker opens a memory map of the same
+        saved image (see method `save`), so all of them share one copy in
+        the page cache. Either way, tries with "array" storage are cheaper
+        to share, as they consist of a handful of objects only.
+
+        Results are yielded in the order of the input documents and at most
+        `2 * n_workers` chunks are in flight at any time, so memory stays
+        bounded for arbitrarily long inputs.
+
+        Parameters
+        ----------
+        docs: Iterable[str]
+            The documents to search, possibly a lazy generator. Documents
+            can also be sequences of tokens (see method `search`).
+
+        n_workers: Optional[int]
+            Number of worker processes. Defaults to the number of CPUs. With
+            a single worker, documents are searched in the calling process.
+
+        chunksize: int
+            Number of documents sent to a worker at once.
+
+        Returns
+        -------
+        Iterator[List[str]]
+            A generator with the output of `search` for every document.
+
+        """
+        n_workers = n_workers or os.cpu_count() or 1
+        if n_workers == 1:
+            for doc in docs:
+                yield self.search(doc)
+            return
+
+        context = get_context()
+        token = f"{os.getpid()}:{id(self)}"
+        path, initializer, initargs = None, None, ()
+        if context.get_start_method() == "fork":
+            _SHARED_TRIES[token] = self
+        else:
+            shared = self
+            if getattr(self._nodes, "source", None) is None:
+                handle, path = tempfile.mkstemp(suffix=".trie")
+                os.close(handle)
+                self.save(path)
+                shared = Trie.open(path, tokenizer=self.tokenizer)
+            initializer, initargs = _install_trie, (token, shared)
+
+        try:
+            with context.Pool(n_workers, initializer, initargs) as pool:
+                pending = deque([])
+                chunk = []
+                for doc in docs:
+                    chunk.append(doc)
+                    if len(chunk) == chunksize:
+                        pending.append(
+                            pool.apply_async(_search_chunk, (token, chunk))
+                        )
+                        chunk = []
+                        if len(pending) >= 2 * n_workers:
+                            yield from pending.popleft().get()
+                if chunk:
+                    pending.append(pool.apply_async(_search_chunk, (token, chunk)))
+                while pending:
+                    yield from pending.popleft().get()
+        finally:
+            _SHARED_TRIES.pop(token, None)
+            if path is not None:
+                os.remove(path)
+
+    def __call__(self, word: str) -> List[str]:
+        """
+        Parameters
+        ----------
+        word: str
+            A string of arbitrary length to look up on the trie.
+
+        Returns
+        -------
+        bool
+            True if the trie contains the value denoted by the input
+            argument, and False otherwise.
+
+            A full match is required (over all the characters in the input
+            string), otherwise no matches are returned and none are assumed
+            to exist.
+
+            The look-up walks at most `len(word)` nodes and does not depend
+            on the number of terms starting with `word`.
+
+            To get matches for partial strings, use method `search` instead.
+        """
+        return [word] if self.__exact(word) else []
+
+    def __pull_all_children(self, prefix: str, node: Any) -> List[str]:
+        children = []
+        entries = self._nodes.entries
+        stack = [(prefix, entries(node))]
+        while stack:
+            prefix, pending = stack[-1]
+            for char, child in pending:
+                if char is None:
+                    children.append(prefix)
+                else:
+                    stack.append((prefix + char, entries(child)))
+                    break
+            else:
+                stack.pop()
+        return children
+
+
+class ConcurrentTrie:
+    """
+    A trie that can be searched by any number of threads while another
+    thread updates it. A plain `Trie` must not be read while it is being
+    modified, as readers could walk nodes in the middle of a change.
+
+    Readers are served by the current snapshot, a `Trie` that is never
+    modified once published. Writers apply their changes in batches to a
+    private copy of the snapshot (see method `update`), which then replaces
+    it in a single attribute assignment, which is atomic. Readers therefore
+    never take a lock and never see a half-applied batch; writers are
+    serialized by a lock among themselves.
+
+    All read methods of `Trie` (`search`, `complete`, `count`, `scan`,
+    `top_k`, `in`, `len`, etc.) are available and run on the snapshot that
+    is current when they are called. A reader needing several calls to see
+    the same version should hold on to `snapshot()` instead.
+
+    Parameters
+    ----------
+    trie: Optional[snippyts.Trie]
+        Initial contents. It is copied, so the caller can go on modifying
+        it. A new empty trie is created from `kwargs` if not given.
+
+    kwargs: Any
+        Arguments of the `Trie` constructor.
+
+    Examples
+    --------
+    >>> concurrent = ConcurrentTrie(storage="array")
+    >>> with concurrent.update() as draft:
+    ...     draft += ["orca", "orco"]
+    ...     removed = draft.remove("orca")
+    >>> concurrent.search("orc"), len(concurrent), "orco" in concurrent
+    (['orco'], 1, True)
+    >>> snapshot = concurrent.snapshot()
+    >>> with concurrent.update() as draft:
+    ...     draft.add("oro")
+    >>> snapshot.count("or"), concurrent.count("or")
+    (1, 2)
+
+    """
+
+    def __init__(self, trie: Optional[Trie] = None, **kwargs: Any) -> None:
+        trie = Trie(**kwargs) if trie is None else trie.copy()
+        self._frozen = trie._readonly
+        trie._readonly = True
+        self._snapshot = trie
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Trie:
+        """
+        Returns
+        -------
+        snippyts.Trie
+            The current snapshot. It is read-only and is not affected by
+            later updates.
+
+        """
+        return self._snapshot
+
+    @contextmanager
+    def update(self) -> Iterator[Trie]:
+        """
+        Context manager yielding a private, writable copy of the current
+        snapshot. When the block exits, the copy is published as the new
+        snapshot. If the block raises an exception, the copy is discarded
+        and the snapshot is left unchanged.
+
+        The copy costs time proportional to the size of the trie ("array"
+        storage being the fastest to copy), so changes should be batched
+        into as few updates as possible.
+        """
+        with self._lock:
+            draft = self._snapshot.copy()
+            draft._readonly = self._frozen
+            yield draft
+            draft._readonly = True
+            self._snapshot = draft
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes not found on the instance itself.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._snapshot, name)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._snapshot
+
+    def __call__(self, word: str) -> List[str]:
+        return self._snapshot(word)
 
+    def __len__(self) -> int:
+        return len(self._snapshot)
 
 
 def test_speed():
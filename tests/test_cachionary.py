@@ -1,8 +1,15 @@
 import os
+import time
 from pathlib import Path
 
 from src.snippyts import Cachionary
 from src.snippyts.cachionary import Cachionary as CachionaryFromModule
+from src.snippyts.cachionary import (
+    IncompatibleOptionsError,
+    UnsupportedEvictionPolicyError,
+    UnsupportedOptionForFormatError,
+)
+from src.snippyts import cachionary as cachionary_module
 
 PATH_TESTS_MODULE = Path(os.path.realpath(__file__))
 PATH_REPO = PATH_TESTS_MODULE.parent.parent
@@ -50,6 +57,386 @@ def test_cachionary():
     os.remove(path_test_cachionary)
 
 
+def test_max_entries_lru(tmp_path):
+    path = tmp_path / "cachionary.json"
+    cachionary = Cachionary(path, max_entries=3)
+    for key in "abcd":
+        cachionary[key] = key
+    assert cachionary.keys() == ["b", "c", "d"]
+    assert cachionary["b"] == "b"
+    cachionary["e"] = "e"
+    assert cachionary.keys() == ["d", "b", "e"]
+    assert cachionary.n_evicted == 2
+    cachionary.persist()
+    del cachionary
+    reloaded = Cachionary(path, max_entries=2)
+    assert reloaded.keys() == ["b", "e"]
+    assert reloaded.n_evicted == 1
+    del reloaded
+
+
+def test_max_entries_lfu(tmp_path):
+    cachionary = Cachionary(tmp_path / "cachionary.p", format="pickle", max_entries=2, policy="lfu")
+    cachionary[1] = 1
+    cachionary[2] = 2
+    for _ in range(3):
+        cachionary[1]
+    cachionary[3] = 3
+    assert sorted(cachionary.keys()) == [1, 3]
+    cachionary[4] = 4
+    assert sorted(cachionary.keys()) == [1, 4]
+    try:
+        Cachionary(tmp_path / "cachionary.p", policy="fifo")
+        assert False
+    except UnsupportedEvictionPolicyError:
+        pass
+    del cachionary
+
+
+def test_max_bytes(tmp_path):
+    cachionary = Cachionary(tmp_path / "cachionary.json", max_bytes=1000)
+    for idx in range(100):
+        cachionary[str(idx)] = "x" * 100
+        assert cachionary.nbytes <= 1000
+    assert 0 < len(cachionary) < 10
+    assert cachionary.n_evicted == 100 - len(cachionary)
+    assert "99" in cachionary
+    del cachionary
+
+
+def test_ttl(tmp_path):
+    path = tmp_path / "cachionary.json"
+    cachionary = Cachionary(path, ttl=0.2)
+    cachionary["short"] = 1
+    cachionary.set("long", 2, ttl=60)
+    assert "short" in cachionary
+    time.sleep(0.3)
+    assert "short" not in cachionary
+    assert cachionary.get("short") is None
+    assert cachionary.keys() == ["long"]
+    assert cachionary.n_expired == 1
+    cachionary.set("shorter", 3, ttl=0.2)
+    cachionary.persist()
+    del cachionary
+    time.sleep(0.3)
+    reloaded = Cachionary(path)
+    assert reloaded.keys() == ["long"]
+    del reloaded
+
+
+
+def test_journal(tmp_path):
+    for format in ["json", "pickle"]:
+        path = tmp_path / f"cachionary.{format}"
+        cachionary = Cachionary(path, format=format, journal=True, max_entries=3)
+        for key in "abcd":
+            cachionary[key] = key.upper()
+        cachionary.persist()
+        assert not path.exists()
+        assert cachionary.path_journal.exists()
+        del cachionary
+        reloaded = Cachionary(path, format=format, journal=True)
+        assert reloaded.keys() == ["b", "c", "d"]
+        reloaded["e"] = "E"
+        reloaded.persist()
+        del reloaded
+        # A record cut short by a crash is skipped.
+        with open(path.with_name(path.name + ".journal"), "ab") as wrt:
+            wrt.write(b"\x30\x00\x00")
+        reloaded = Cachionary(path, format=format, journal=True)
+        assert reloaded.keys() == ["b", "c", "d", "e"]
+        reloaded["f"] = "F"
+        del reloaded
+        reloaded = Cachionary(path, format=format, journal=True)
+        assert reloaded["f"] == "F" and len(reloaded) == 5
+        del reloaded
+
+
+def test_journal_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(cachionary_module, "MIN_JOURNAL_RECORDS", 10)
+    path = tmp_path / "cachionary.json"
+    cachionary = Cachionary(path, journal=True)
+    for idx in range(25):
+        cachionary[str(idx % 5)] = idx
+    assert path.exists()
+    assert cachionary._journal_records <= 10
+    del cachionary
+    reloaded = Cachionary(path, journal=True)
+    assert reloaded.keys() == ["0", "1", "2", "3", "4"]
+    assert reloaded.values() == [20, 21, 22, 23, 24]
+    records = reloaded._journal_records
+    reloaded["5"] = 25
+    reloaded.reload()
+    assert reloaded._journal_records == records + 1
+    del reloaded
+
+
+
+def test_dirty_tracking(tmp_path):
+    path = tmp_path / "cachionary.json"
+    cachionary = Cachionary(path, flush_interval=None)
+    cachionary["a"] = 1
+    assert cachionary.new_keys == {"a"}
+    cachionary.persist()
+    assert path.exists() and not cachionary.new_keys
+    os.remove(path)
+    cachionary.persist()
+    assert not path.exists()
+    cachionary["b"] = 2
+    cachionary.persist()
+    assert Cachionary(path, flush_interval=None).keys() == ["a", "b"]
+    assert os.listdir(tmp_path) == ["cachionary.json"]
+    del cachionary
+
+
+def test_background_flush(tmp_path):
+    path = tmp_path / "cachionary.json"
+    cachionary = Cachionary(path, flush_interval=None, flush_every=3)
+    cachionary["a"] = 1
+    cachionary["b"] = 2
+    time.sleep(0.2)
+    assert not path.exists()
+    cachionary["c"] = 3
+    time.sleep(0.2)
+    assert path.exists() and not cachionary.new_keys
+    cachionary.close()
+    assert not cachionary._flusher.is_alive()
+    del cachionary
+
+    cachionary = Cachionary(path, flush_interval=0.1)
+    cachionary["d"] = 4
+    time.sleep(0.5)
+    assert Cachionary(path, flush_interval=None).keys() == ["a", "b", "c", "d"]
+    flusher = cachionary._flusher
+    del cachionary
+    flusher.join(1)
+    assert not flusher.is_alive()
+
+
+
+def test_sqlite(tmp_path):
+    path = tmp_path / "cachionary.db"
+    cachionary = Cachionary(path, format="sqlite", hot_entries=10, flush_interval=None)
+    for idx in range(100):
+        cachionary[(idx, "key")] = {"value": idx}
+    assert len(cachionary.payload) <= 10
+    assert cachionary[(3, "key")] == {"value": 3}
+    assert (100, "key") not in cachionary
+    assert len(cachionary) == 100
+    cachionary.set("short", 1, ttl=0.1)
+    del cachionary
+    time.sleep(0.2)
+
+    reloaded = Cachionary(path, format="sqlite", hot_entries=10, flush_interval=None)
+    assert not reloaded.payload
+    assert reloaded.get((50, "key")) == {"value": 50}
+    assert len(reloaded.payload) == 1
+    assert "short" not in reloaded
+    assert len(reloaded) == 100
+    assert sorted(reloaded.keys())[:2] == [(0, "key"), (1, "key")]
+    reloaded[(0, "key")] = "changed"
+    del reloaded
+    reloaded = Cachionary(path, format="sqlite", flush_interval=None)
+    assert reloaded[(0, "key")] == "changed"
+    del reloaded
+
+    try:
+        Cachionary(path, format="sqlite", max_entries=10)
+        assert False
+    except UnsupportedOptionForFormatError:
+        pass
+
+
+
+def test_memoize(tmp_path):
+    path = tmp_path / "cachionary.json"
+    cachionary = Cachionary(path, flush_interval=None)
+    calls = []
+
+    @cachionary.memoize()
+    def add(a, b=1):
+        calls.append((a, b))
+        return a + b
+
+    assert add(1) == 2
+    assert add(1, 1) == 2 and add(a=1, b=1) == 2
+    assert add(2, b=3) == 5
+    assert calls == [(1, 1), (2, 3)]
+    assert add.__name__ == "add"
+
+    @cachionary.memoize(key=lambda word: f"upper:{word}")
+    def upper(word):
+        calls.append(word)
+        return word.upper()
+
+    assert upper("a") == upper("a") == "A"
+    assert cachionary["upper:a"] == "A"
+    cachionary.persist()
+
+    reloaded = Cachionary(path, flush_interval=None)
+
+    @reloaded.memoize()
+    def add(a, b=1):
+        calls.append((a, b))
+        return a + b
+
+    assert add(2, 3) == 5
+    assert calls == [(1, 1), (2, 3), "a"]
+    del reloaded
+
+
+def test_memoize_single_flight(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    cachionary = Cachionary(tmp_path / "cachionary.p", format="pickle", flush_interval=None)
+    calls = []
+
+    @cachionary.memoize()
+    def slow(x):
+        calls.append(x)
+        time.sleep(0.2)
+        if x < 0:
+            raise ValueError(x)
+        return x * 2
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(slow, [1] * 8 + [2] * 8))
+    assert results == [2] * 8 + [4] * 8
+    assert sorted(calls) == [1, 2]
+
+    def failing(_):
+        try:
+            slow(-1)
+        except ValueError:
+            return "failed"
+
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(failing, range(4))) == ["failed"] * 4
+    assert calls.count(-1) < 4
+    assert not cachionary._flights
+    assert failing(0) == "failed" and calls.count(-1) >= 2
+
+
+def test_persisted_file_mode(tmp_path):
+    umask = os.umask(0)
+    os.umask(umask)
+    path = tmp_path / "cachionary.json"
+    cachionary = Cachionary(path, flush_interval=None)
+    cachionary["a"] = 1
+    cachionary.persist()
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+    os.chmod(path, 0o640)
+    cachionary["b"] = 2
+    cachionary.persist()
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    cachionary.close()
+
+
+def _write_shared(path, worker):
+    cachionary = Cachionary(path, format="pickle", shared=True, flush_interval=None)
+    for idx in range(50):
+        cachionary[f"{worker}:{idx}"] = idx
+        if not idx % 10:
+            cachionary.persist()
+    cachionary.close()
+
+
+def test_shared(tmp_path):
+    from multiprocessing import get_context
+
+    path = tmp_path / "cachionary.p"
+    first = Cachionary(path, format="pickle", shared=True, flush_interval=None)
+    second = Cachionary(path, format="pickle", shared=True, flush_interval=None)
+    first["a"] = 1
+    second["b"] = 2
+    first.persist()
+    second.persist()
+    assert cachionary_module.from_pickle(path) == {"a": 1, "b": 2}
+    assert "a" in second and "b" not in first
+
+    # Keys turned into strings by JSON are still the same keys.
+    numbered = Cachionary(tmp_path / "numbered.json", shared=True, flush_interval=None)
+    numbered[1] = "a"
+    numbered.persist()
+    numbered[2] = "b"
+    numbered.persist()
+    assert numbered.keys() == [1, 2] and 1 in numbered
+    numbered.close()
+
+    # Changes not persisted yet win over those persisted by others.
+    second["a"] = 2
+    first["a"] = 3
+    second.persist()
+    first.persist()
+    assert cachionary_module.from_pickle(path) == {"a": 3, "b": 2}
+    assert dict(first.payload) == {"a": 3, "b": 2}
+
+    reader = Cachionary(path, format="pickle", shared=True, refresh_on_miss=True, flush_interval=None)
+    second["c"] = 4
+    second.persist()
+    assert reader["c"] == 4
+    first.close(); second.close(); reader.close()
+
+    with get_context("fork").Pool(4) as pool:
+        pool.starmap(_write_shared, [(path, worker) for worker in range(4)])
+    merged = cachionary_module.from_pickle(path)
+    assert all(f"{worker}:{idx}" in merged for worker in range(4) for idx in range(50))
+
+    try:
+        Cachionary(path, shared=True, journal=True)
+        assert False
+    except IncompatibleOptionsError:
+        pass
+
+def test_shards(tmp_path):
+    path = tmp_path / "cachionary.json"
+    cachionary = Cachionary(path, shards=4, ttl=60, flush_interval=None)
+    for idx in range(100):
+        cachionary[f"key{idx}"] = idx
+    cachionary.persist()
+    assert not path.exists()
+    shard_paths = [tmp_path / f"cachionary.json.{idx}" for idx in range(4)]
+    assert all(shard_path.exists() for shard_path in shard_paths)
+    assert sum(len(cachionary_module.from_json(shard_path)) for shard_path in shard_paths) == 100
+
+    # Only the shard holding the changed entry is rewritten.
+    mtimes = [os.stat(shard_path).st_mtime_ns for shard_path in shard_paths]
+    time.sleep(0.01)
+    cachionary["key0"] = -1
+    cachionary.persist()
+    changed = [
+        os.stat(shard_path).st_mtime_ns != mtime
+        for shard_path, mtime in zip(shard_paths, mtimes)
+    ]
+    assert sum(changed) == 1
+    cachionary.close()
+
+    reloaded = Cachionary(path, shards=4, flush_interval=None)
+    assert len(reloaded) == 100 and reloaded["key0"] == -1
+    assert len(reloaded.expires) == 100
+    reloaded.close()
+
+    pickled = Cachionary(tmp_path / "cachionary.p", format="pickle", shards=3, flush_interval=None)
+    pickled[(1, 2)] = "a"
+    pickled.close()
+    assert Cachionary(tmp_path / "cachionary.p", format="pickle", shards=3, flush_interval=None)[(1, 2)] == "a"
+
+    # Equal keys hashing to different shards stay in the first one.
+    evicting = Cachionary(tmp_path / "equal.p", format="pickle", shards=3, max_entries=1, flush_interval=None)
+    evicting[1] = "a"
+    evicting[1.0] = "b"
+    evicting[2] = "c"
+    evicting.persist()
+    assert Cachionary(tmp_path / "equal.p", format="pickle", shards=3, flush_interval=None).keys() == [2]
+    evicting.close()
+
+    for kwargs in [dict(format="sqlite"), dict(journal=True)]:
+        try:
+            Cachionary(tmp_path / "other", shards=2, **kwargs)
+            assert False
+        except (IncompatibleOptionsError, UnsupportedOptionForFormatError):
+            pass
+
 
 if __name__ == "__main__":
     test_cachionary()
@@ -4,6 +4,7 @@ import pytest
 from tqdm import tqdm
 
 from src.snippyts.metrics import average_token_similarity
+from src.snippyts.tokenization import wordpunct_tokenize
 
 
 def test_performance_average_token_similarity():
@@ -80,4 +81,21 @@ def test_average_token_similarity():
     ]
     for arg0, arg1, sim in tests:
         assert average_token_similarity(arg0, arg1) == sim
-        assert average_token_similarity(arg1, arg0) == sim
\ No newline at end of file
+        assert average_token_similarity(arg1, arg0) == sim
+
+def test_average_token_similarity_tokenizers():
+    arg0 = "Film: The 1927 film Metropolis is considered a pioneering work of science fiction."
+    arg1 = "Film: The 1927 film Metropolis is a work of science fiction."
+    sim = average_token_similarity(arg0, arg1)
+    assert average_token_similarity(
+        wordpunct_tokenize(arg0), wordpunct_tokenize(arg1)
+    ) == sim
+    assert average_token_similarity(arg0, arg1, tokenizer=str.split) != sim
+    assert average_token_similarity(
+        tuple(wordpunct_tokenize(arg0)), tuple(wordpunct_tokenize(arg1))
+    ) == sim
+    assert average_token_similarity(arg0, None) == 0
+    assert average_token_similarity(b"ab", b"ab") == 0
+    assert average_token_similarity(bytearray(b"ab"), "ab") == 0
+    assert average_token_similarity([1], [2]) == 0
+    assert average_token_similarity(("a", 1), ("a", "b")) == 0
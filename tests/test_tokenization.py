@@ -0,0 +1,45 @@
+import pickle
+import random
+
+from nltk import wordpunct_tokenize as nltk_wordpunct_tokenize
+
+from src.snippyts.tokenization import (
+    RegexTokenizer,
+    span_tokenize,
+    tokenize,
+    wordpunct_tokenize,
+)
+
+
+TEXT = (
+    "¿Ok? Entonces va a ser, es mucho dependiendo de lo que tú quieras también"
+    ", ¿ok? Esa es la diferencia principal entre el mirena y el de cobre... "
+    "Descartes’ famous statement “Cogito, ergo sum” (1637) -- 13,000 houses!"
+)
+
+
+def test_wordpunct_tokenize_matches_nltk():
+    assert wordpunct_tokenize(TEXT) == nltk_wordpunct_tokenize(TEXT)
+    chars = "ab c.,;!¿?áé  \n\t'’-_0"
+    for _ in range(500):
+        text = ''.join(random.choice(chars) for _ in range(random.randrange(30)))
+        assert wordpunct_tokenize(text) == nltk_wordpunct_tokenize(text)
+
+
+def test_span_tokenize():
+    for tokenizer in [wordpunct_tokenize, str.split, RegexTokenizer(r"\w+")]:
+        triples = list(span_tokenize(TEXT, tokenizer))
+        assert [token for _, _, token in triples] == tokenizer(TEXT)
+        for start, end, token in triples:
+            assert TEXT[start:end] == token
+
+
+def test_pretokenized_input():
+    tokens = ["New York", "1927"]
+    assert tokenize(tokens) is tokens
+    assert list(span_tokenize(tokens)) == [(0, 1, "New York"), (1, 2, "1927")]
+
+
+def test_pickle():
+    tokenizer = pickle.loads(pickle.dumps(RegexTokenizer(r"\S+")))
+    assert tokenizer("a b. c") == ["a", "b.", "c"]
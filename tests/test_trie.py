@@ -0,0 +1,602 @@
+import os
+import random
+import tempfile
+import threading
+from array import array
+from collections import Counter
+from fnmatch import fnmatchcase
+
+from src.snippyts.tokenization import RegexTokenizer
+from src.snippyts.trie import (
+    SUPPORTED_STORAGES,
+    ConcurrentTrie,
+    IncompatibleTrieError,
+    InvalidCapacityError,
+    Match,
+    ReadOnlyTrieError,
+    TermIdsDisabledError,
+    Trie,
+)
+
+
+SEED = 13
+
+
+def test_array_storage():
+    random.seed(SEED)
+    letters = list('qwertyuiopasdfghjklzxcvbnm')
+    vocab = [
+        ''.join(random.choice(letters) for _ in range(random.randrange(3, 15)))
+        for _ in range(20000)
+    ]
+    by_dict = Trie()
+    by_dict += vocab
+    by_array = Trie(storage="array")
+    by_array += vocab
+    for word in random.sample(vocab, 1000) + ["a", "qw", "Arda"]:
+        assert by_dict.search(word) == by_array.search(word)
+        assert by_dict(word) == by_array(word)
+        assert (word in by_dict) == (word in by_array)
+    assert by_array.bytes_per_term() * 8 < by_dict.bytes_per_term()
+
+
+def test_complete():
+    random.seed(SEED)
+    letters = list('abcde')
+    vocab = sorted(set(
+        ''.join(random.choice(letters) for _ in range(random.randrange(1, 7)))
+        for _ in range(2000)
+    ))
+    for storage in SUPPORTED_STORAGES:
+        trie = Trie(storage=storage)
+        trie += random.sample(vocab, len(vocab))
+        assert list(trie.complete()) == vocab
+        for _ in range(500):
+            prefix, start, stop = [
+                ''.join(random.choice(letters) for _ in range(random.randrange(4)))
+                for _ in range(3)
+            ]
+            offset = random.choice([0, 3, 100])
+            expected = [
+                word for word in vocab
+                if word.startswith(prefix) and start <= word < stop
+            ][offset:offset + 10]
+            assert list(trie.complete(
+                prefix, limit=10, offset=offset, start=start, stop=stop
+            )) == expected
+            assert trie.count(prefix) == sum(
+                word.startswith(prefix) for word in vocab
+            )
+
+
+def test_scan():
+    random.seed(SEED)
+    vocab = set(
+        ''.join(random.choice('ab ') for _ in range(random.randrange(1, 5))).strip()
+        for _ in range(200)
+    ) - {''}
+    for storage in SUPPORTED_STORAGES:
+        trie = Trie(storage=storage)
+        trie += vocab
+        for _ in range(200):
+            text = ''.join(random.choice('abAB .') for _ in range(40))
+            lowered = text.lower()
+            expected = sorted(
+                (idx, term) for term in vocab for idx in range(len(text))
+                if lowered.startswith(term, idx)
+            )
+            found = trie.scan(text, policy="all", boundaries=False)
+            assert found == [term for _, term in expected]
+            longest = trie.scan(text, boundaries=False)
+            assert set(longest) <= set(found)
+
+
+def test_from_iterable():
+    random.seed(SEED)
+    vocab = [
+        ''.join(random.choice('abcdeÁÉ') for _ in range(random.randrange(7)))
+        for _ in range(5000)
+    ]
+    for storage in SUPPORTED_STORAGES:
+        expected = Trie(storage=storage)
+        expected += vocab
+        for presorted in [False, True]:
+            for minimize in [False, True]:
+                trie = Trie.from_iterable(
+                    vocab, presorted=presorted, minimize=minimize,
+                    batch_size=100, storage=storage
+                )
+                assert list(trie.complete()) == list(expected.complete())
+                for prefix in ['', 'a', 'ab', 'e', 'x']:
+                    assert trie.count(prefix) == expected.count(prefix)
+                    assert sorted(trie.search(prefix)) == sorted(expected.search(prefix))
+
+
+def test_minimized_stays_read_only():
+    path = os.path.join(tempfile.mkdtemp(), "dawg.trie")
+    words = ["cantar", "cantaba", "saltar", "saltaba"]
+    for storage in SUPPORTED_STORAGES:
+        Trie.from_iterable(words, minimize=True, storage=storage).save(path)
+        for trie in [
+            Trie.open(path, mmap=False),
+            Trie.open(path).copy(),
+            Trie.open(path, mmap=False).copy(),
+        ]:
+            for change in [lambda: trie.add("saltarin"), lambda: trie.remove("cantar")]:
+                try:
+                    change()
+                    assert False
+                except ReadOnlyTrieError:
+                    pass
+            assert len(trie) == 4 and sorted(trie.complete()) == sorted(words)
+        concurrent = ConcurrentTrie(Trie.open(path, mmap=False))
+        try:
+            with concurrent.update() as draft:
+                draft.add("saltarin")
+            assert False
+        except ReadOnlyTrieError:
+            pass
+        assert len(concurrent) == 4
+    os.remove(path)
+
+
+def test_save_file_mode():
+    umask = os.umask(0)
+    os.umask(umask)
+    path = os.path.join(tempfile.mkdtemp(), "mode.trie")
+    trie = Trie.from_iterable(["orca", "orco"])
+    trie.save(path)
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+    os.chmod(path, 0o640)
+    Trie.open(path).save(path)
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    os.remove(path)
+
+
+def test_fuzzy():
+    random.seed(SEED)
+    def levenshtein(a, b):
+        row = list(range(len(b) + 1))
+        for idx, char in enumerate(a, 1):
+            previous, row = row, [idx]
+            for col in range(1, len(b) + 1):
+                row.append(min(
+                    row[-1] + 1, previous[col] + 1,
+                    previous[col - 1] + (b[col - 1] != char)
+                ))
+        return row[-1]
+
+    vocab = sorted(set(
+        ''.join(random.choice('abcd') for _ in range(random.randrange(1, 8)))
+        for _ in range(1000)
+    ))
+    for storage in SUPPORTED_STORAGES:
+        trie = Trie(storage=storage)
+        trie += vocab
+        for _ in range(50):
+            word = ''.join(random.choice('abcd') for _ in range(random.randrange(8)))
+            for max_edits in range(3):
+                expected = sorted(
+                    (levenshtein(word, term), term) for term in vocab
+                    if levenshtein(word, term) <= max_edits
+                )
+                assert trie.fuzzy(word, max_edits) == expected
+
+
+def test_top_k():
+    random.seed(SEED)
+    for storage in SUPPORTED_STORAGES:
+        trie = Trie(storage=storage)
+        scores = dict([])
+        for _ in range(2000):
+            word = ''.join(random.choice('abc') for _ in range(random.randrange(1, 6)))
+            score = random.choice([None, random.randrange(100)])
+            trie.add(word, score=score)
+            if score is not None:
+                scores[word] = score
+        for prefix in ['', 'a', 'ab', 'cc']:
+            for k in [1, 5, 50]:
+                expected = sorted(
+                    (-score, word) for word, score in scores.items()
+                    if word.startswith(prefix)
+                )[:k]
+                assert trie.top_k(prefix, k) == [
+                    (-score, word) for score, word in expected
+                ]
+
+
+def test_search_many():
+    random.seed(SEED)
+    trie = Trie(storage="array")
+    trie += ['mes', 'mirena', 'ok', 'oro', 'orca']
+    words = ['ok', 'mes', 'or', 'mi', 'x', 'Ok', 'orcas']
+    docs = [
+        ' '.join(random.choice(words) for _ in range(random.randrange(10)))
+        for _ in range(5000)
+    ]
+    expected = [trie.search(doc) for doc in docs]
+    assert list(trie.search_many(docs, n_workers=1)) == expected
+    assert list(trie.search_many(iter(docs), n_workers=2, chunksize=64)) == expected
+
+
+def test_spans():
+    random.seed(SEED)
+    vocab = ["oración", "Oráculo", "orca", "Ñandú", "new york", "cañón"]
+    text = "La ORACIÓN del oráculo: orcas, ñandúes y un cañón en New York."
+    path = os.path.join(tempfile.mkdtemp(), "spans.trie")
+    for storage in SUPPORTED_STORAGES:
+        built = Trie(storage=storage, keep_surfaces=True)
+        built += vocab
+        built.save(path)
+        merged = Trie(storage=storage, keep_surfaces=True)
+        merged += vocab[:2]
+        merged |= Trie.from_iterable(vocab, keep_surfaces=True)
+        for trie in [
+            built,
+            merged,
+            Trie.from_iterable(
+                random.sample(vocab, len(vocab)), storage=storage,
+                keep_surfaces=True
+            ),
+            Trie.from_iterable(
+                vocab, minimize=True, storage=storage, keep_surfaces=True
+            ),
+            Trie.open(path),
+        ]:
+            matches = trie.search(text, spans=True)
+            assert [match.term for match in matches] == trie.search(text)
+            for start, end, term, surface in matches:
+                assert trie.search(text[start:end]).count(term)
+                assert trie.search(surface) == [term]
+            assert [surface for _, _, _, surface in matches] == [
+                "oración", "Oráculo", "cañón", "new york"
+            ]
+            for start, end, term, surface in trie.scan(text, spans=True):
+                assert trie.scan(text[start:end]) == [term]
+                assert surface in vocab
+        plain = Trie(storage=storage)
+        plain += vocab
+        assert plain.search("oráculo", spans=True)[0].surface == "oraculo"
+        assert plain.nbytes() < built.nbytes()
+    os.remove(path)
+
+    # Surface forms do not keep nodes from being merged.
+    stems = ["cant", "salt", "bail", "corr", "nad"]
+    endings = ["ar", "aba", "aron", "ando", "ado"]
+    words = [f"{stem}{ending}".capitalize() for stem in stems for ending in endings]
+    kept = Trie.from_iterable(words, minimize=True, keep_surfaces=True)
+    lowered = Trie.from_iterable([word.lower() for word in words], minimize=True)
+    assert kept._nodes.n_nodes() == lowered._nodes.n_nodes()
+    assert kept.search("Cantaba", spans=True)[0].surface == "Cantaba"
+
+
+def test_remove():
+    random.seed(SEED)
+    vocab = sorted(set(
+        ''.join(random.choice('abcd') for _ in range(random.randrange(1, 7)))
+        for _ in range(3000)
+    ))
+    for storage in SUPPORTED_STORAGES:
+        trie = Trie(storage=storage)
+        scores = dict([])
+        for word in vocab:
+            scores[word] = random.randrange(100)
+            trie.add(word, value=word.upper(), score=scores[word])
+        for _ in range(2000):
+            word = random.choice(vocab)
+            if random.random() < 0.7:
+                assert trie.remove(word) == (word in scores)
+                scores.pop(word, None)
+            elif word not in scores:
+                scores[word] = random.randrange(100)
+                trie.add(word, value=word.upper(), score=scores[word])
+        expected = Trie(storage=storage)
+        expected += scores
+        assert len(trie) == len(scores)
+        assert list(trie.complete()) == sorted(scores)
+        assert trie.stats()["n_nodes"] == expected.stats()["n_nodes"]
+        for prefix in ['', 'a', 'ab', 'dc']:
+            assert trie.count(prefix) == expected.count(prefix)
+            assert [term for _, term in trie.top_k(prefix, 5)] == [
+                word for _, word in sorted(
+                    (-score, word) for word, score in scores.items()
+                    if word.startswith(prefix)
+                )[:5]
+            ]
+        for word in random.sample(vocab, 100):
+            assert trie.get(word) == (word.upper() if word in scores else None)
+        trie -= list(scores)
+        assert len(trie) == 0 and trie.stats()["n_nodes"] == 1
+
+
+def test_tokenizer():
+    text = "el mirena, mes-con-mes"
+    trie = Trie()
+    trie += ['mes', 'mirena', 'mes-con-mes']
+    assert trie.search(text) == [
+        'mirena', 'mes', 'mes-con-mes', 'mes', 'mes-con-mes'
+    ]
+    assert trie.search(text.split()) == ['mes-con-mes']
+    assert trie.search(text.split(), spans=True) == [
+        Match(2, 3, 'mes-con-mes', 'mes-con-mes')
+    ]
+    trie = Trie(tokenizer=RegexTokenizer(r"[\w-]+"))
+    trie += ['mes', 'mirena', 'mes-con-mes']
+    assert trie.search(text) == ['mirena', 'mes-con-mes']
+    assert [match.start for match in trie.search(text, spans=True)] == [3, 11]
+    assert list(trie.search_many([text] * 10, n_workers=2, chunksize=3)) == [
+        ['mirena', 'mes-con-mes']
+    ] * 10
+
+
+def test_counting():
+    random.seed(SEED)
+    vocab = [
+        ''.join(random.choice('abcdefgh') for _ in range(random.randrange(1, 6)))
+        for _ in range(2000)
+    ]
+    # Zipfian stream: the i-th term is drawn with probability ~ 1 / (i + 1).
+    stream = random.choices(vocab, weights=[1 / (i + 1) for i in range(2000)], k=30000)
+    counts = Counter(stream)
+    for storage in SUPPORTED_STORAGES:
+        exact = Trie(counting=True, storage=storage)
+        exact += stream
+        assert len(exact) == len(counts)
+        assert [count for _, count in exact.most_common(20)] == [
+            count for _, count in counts.most_common(20)
+        ]
+        for prefix in ['', 'a', 'ab', 'h']:
+            assert exact.total(prefix) == sum(
+                count for word, count in counts.items() if word.startswith(prefix)
+            )
+
+        capacity = 200
+        bounded = Trie(counting=True, capacity=capacity, storage=storage)
+        for word in stream:
+            bounded.add(word)
+            assert len(bounded) <= capacity
+        assert bounded.total() == len(stream)
+        for word, count in counts.items():
+            if count > len(stream) / capacity:
+                assert bounded.frequency(word) >= count
+        top = [word for word, _ in counts.most_common(10)]
+        assert set(top) <= set(word for word, _ in bounded.most_common(20))
+        assert bounded.stats()["n_nodes"] < exact.stats()["n_nodes"]
+
+    for kwargs in [dict(capacity=2), dict(counting=True, capacity=0)]:
+        try:
+            Trie(**kwargs)
+            assert False
+        except InvalidCapacityError:
+            pass
+
+
+def test_match():
+    random.seed(SEED)
+    vocab = sorted(set(
+        ''.join(random.choice('abcd') for _ in range(random.randrange(1, 7)))
+        for _ in range(2000)
+    ))
+    pieces = ['a', 'b', 'c', 'd', '?', '*', '[ab]', '[!a]', '[b-d]', '[]', '[']
+    for storage in SUPPORTED_STORAGES:
+        trie = Trie(storage=storage)
+        trie += vocab
+        for _ in range(300):
+            pattern = ''.join(
+                random.choice(pieces) for _ in range(random.randrange(1, 6))
+            )
+            assert list(trie.match(pattern)) == [
+                word for word in vocab if fnmatchcase(word, pattern)
+            ], pattern
+
+
+def test_contains_substring():
+    random.seed(SEED)
+    vocab = sorted(set(
+        ''.join(random.choice('abcd') for _ in range(random.randrange(1, 9)))
+        for _ in range(3000)
+    ))
+    for storage in SUPPORTED_STORAGES:
+        trie = Trie(storage=storage)
+        trie += vocab
+        for _ in range(2):
+            for _ in range(300):
+                query = ''.join(
+                    random.choice('abcd') for _ in range(random.randrange(5))
+                )
+                expected = [word for word in vocab if query in word]
+                found = trie.contains_substring(query)
+                assert sorted(found) == expected and len(set(found)) == len(found)
+                limited = trie.contains_substring(query, limit=5)
+                assert set(limited) <= set(expected)
+                assert len(limited) == min(5, len(expected))
+            removed = random.sample(vocab, 200)
+            trie -= removed
+            trie += ['xabcx']
+            vocab = sorted(set(vocab) - set(removed) | {'xabcx'})
+        assert trie.contains_substring('bcx') == ['xabcx']
+
+
+def test_concurrent():
+    random.seed(SEED)
+    words = [
+        ''.join(random.choice('abcde') for _ in range(random.randrange(1, 8)))
+        for _ in range(20000)
+    ]
+    for storage in SUPPORTED_STORAGES:
+        concurrent = ConcurrentTrie(storage=storage)
+        errors = []
+        done = threading.Event()
+
+        def read():
+            try:
+                last = 0
+                while not done.is_set():
+                    snapshot = concurrent.snapshot()
+                    found = len(snapshot.search("a")) + len(snapshot.search("b"))
+                    assert found == snapshot.count("a") + snapshot.count("b")
+                    # Terms are only added, so versions never shrink.
+                    assert len(snapshot) >= last
+                    last = len(snapshot)
+            except Exception as error:
+                errors.append(error)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for start in range(0, len(words), 1000):
+            with concurrent.update() as draft:
+                for word in words[start:start + 1000]:
+                    draft.add(word)
+        done.set()
+        for reader in readers:
+            reader.join()
+        assert not errors, errors
+        assert len(concurrent) == len(set(words))
+        try:
+            concurrent.add("x")
+            assert False
+        except ReadOnlyTrieError:
+            pass
+        try:
+            with concurrent.update() as draft:
+                draft.add("x")
+                raise KeyError
+        except KeyError:
+            pass
+        assert "x" not in concurrent
+
+
+def test_merge():
+    random.seed(SEED)
+    vocab = [
+        ''.join(random.choice('abcdÉ') for _ in range(random.randrange(1, 7)))
+        for _ in range(4000)
+    ]
+    for storage in SUPPORTED_STORAGES:
+        for other_storage in SUPPORTED_STORAGES:
+            trie = Trie(storage=storage)
+            other = Trie(storage=other_storage)
+            expected = Trie()
+            scores = dict([])
+            for word in vocab:
+                score = scores.setdefault(word, random.randrange(100))
+                target = random.choice([trie, other])
+                target.add(word, value=score, score=score)
+                expected.add(word, value=score, score=score)
+            if random.random() < 0.5:
+                other.minimize()
+            before = list(other.complete())
+            trie |= other
+            assert list(other.complete()) == before
+            assert len(trie) == len(expected)
+            assert list(trie.complete()) == list(expected.complete())
+            for prefix in ['', 'a', 'ab', 'c']:
+                assert trie.count(prefix) == expected.count(prefix)
+                assert trie.top_k(prefix, 5) == expected.top_k(prefix, 5)
+            for word in random.sample(vocab, 200):
+                assert trie.get(word) == expected.get(word)
+
+    first, second = Trie(counting=True), Trie(counting=True, storage="array")
+    first += ['oro', 'orca', 'oro']
+    second += ['oro', 'orco']
+    first |= second
+    assert first.most_common() == [('oro', 3), ('orca', 1), ('orco', 1)]
+    try:
+        first |= Trie(case_sensitive=True)
+        assert False
+    except IncompatibleTrieError:
+        pass
+
+    for storage in SUPPORTED_STORAGES:
+        for presorted in [False, True]:
+            expected = Trie.from_iterable(
+                vocab, presorted=presorted, storage=storage
+            )
+            trie = Trie.from_iterable(
+                vocab, presorted=presorted, storage=storage, n_workers=3
+            )
+            assert list(trie.complete()) == list(expected.complete())
+            for prefix in ['', 'a', 'ab', 'e', 'x']:
+                assert trie.count(prefix) == expected.count(prefix)
+                assert trie.search(prefix) == expected.search(prefix)
+
+
+
+def test_term_ids():
+    random.seed(SEED)
+    def check(trie):
+        # Every term maps to a distinct id and back.
+        terms = list(trie.complete())
+        ids = [trie.term_id(term) for term in terms]
+        assert len(set(ids)) == len(terms)
+        assert all(0 <= idx < trie._n_ids for idx in ids)
+        for term, idx in zip(terms, ids):
+            assert trie.id_to_term(idx) == term
+        for prefix in ['', 'a', 'ab', 'c', 'x']:
+            found = trie.search(prefix, ids=True)
+            assert [trie.id_to_term(idx) for idx in found] == trie.search(prefix)
+        return dict(zip(terms, ids))
+
+    vocab = [
+        ''.join(random.choice('abcdÉ') for _ in range(random.randrange(1, 7)))
+        for _ in range(3000)
+    ]
+    path_trie = "trie_ids.bin"
+    for storage in SUPPORTED_STORAGES:
+        trie = Trie(storage=storage, term_ids=True)
+        trie += vocab
+        ids = check(trie)
+        removed = random.sample(sorted(ids), len(ids) // 2)
+        trie -= removed
+        for word in removed:
+            assert trie.term_id(word) is None
+            try:
+                trie.id_to_term(ids[word])
+                assert False
+            except KeyError:
+                pass
+        kept = check(trie)
+        assert all(ids[term] == idx for term, idx in kept.items())
+        trie.add(removed[0])
+        assert trie.term_id(removed[0]) == len(ids)
+
+        copy = trie.copy()
+        copy._terms = None
+        assert check(copy) == check(trie)
+        trie.save(path_trie)
+        for mmap in [True, False]:
+            loaded = Trie.open(path_trie, mmap=mmap)
+            assert check(loaded) == check(trie)
+            del loaded
+        os.remove(path_trie)
+
+        other = Trie(storage="array", term_ids=True)
+        other += ["zz", "ab", "abcz"]
+        n_ids = trie._n_ids
+        trie |= other
+        assert trie.term_id("zz") >= n_ids
+        merged = check(trie)
+        assert all(merged[term] == idx for term, idx in kept.items())
+
+        counts = trie.search_counts(["a b", "a"])
+        assert len(counts) == trie._n_ids
+        for idx, count in enumerate(counts):
+            if count:
+                term = trie.id_to_term(idx)
+                assert count == 2 * term.startswith("a") + term.startswith("b")
+        assert trie.scan("the ab zz", ids=True) == array("q", [
+            trie.term_id("ab"), trie.term_id("zz")
+        ])
+
+        for n_workers in [1, 3]:
+            built = Trie.from_iterable(
+                vocab, storage=storage, term_ids=True, n_workers=n_workers
+            )
+            assert sorted(check(built).values()) == list(range(len(built)))
+
+    try:
+        Trie().search("a", ids=True)
+        assert False
+    except TermIdsDisabledError:
+        pass